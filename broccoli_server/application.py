@@ -1,20 +1,27 @@
 import logging
 import os
+import signal
+import time
+import hashlib
 import datetime
+import pymongo
 import sentry_sdk
-from typing import Callable, Dict, Optional
-from broccoli_server.utils import getenv_or_raise, DatabaseMigration, WorkerQueue, WorkerPayload
-from broccoli_server.content import ContentStore
+from typing import Callable, Dict, Optional, List, Tuple
+from broccoli_server.utils import getenv_or_raise, DatabaseMigration, WorkerQueue, WorkerPayload, IndexRegistry, \
+    MongoClientRegistry, WorkerRunner, CONCURRENCY_MODES
+from broccoli_server.content import ContentStore, ContentNotifier, QueryCache, InMemoryQueryCache, RedisQueryCache
 from broccoli_server.worker import WorkerConfigStore, GlobalMetadataStore, WorkerMetadata, WorkerCache, \
-    MetadataStoreFactory, WorkContextFactory, WorkFactory
+    MetadataStoreFactory, WorkContextFactory, WorkFactory, WorkerPool
 from broccoli_server.reconciler import Reconciler
-from broccoli_server.mod_view import ModViewStore, ModViewRenderer, ModViewQuery
+from broccoli_server.mod_view import ModViewStore, ModViewRenderer, ModViewQuery, ModViewCounter
 from broccoli_server.interface.api import ApiHandler
 from broccoli_server.job import JobScheduler, JobRunsStore, JobFactory
 from werkzeug.routing import IntegerConverter
-from flask import Flask, request, jsonify, send_from_directory, redirect
+from flask import Flask, Response, request, jsonify, send_from_directory, redirect, stream_with_context, json
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, verify_jwt_in_request
+from flask_jwt_extended import JWTManager, create_access_token, verify_jwt_in_request, decode_token
+
+logger = logging.getLogger(__name__)
 
 
 class Application(object):
@@ -35,55 +42,153 @@ class Application(object):
 
         self.instance_title = os.environ.get('INSTANCE_TITLE', 'Untitled')
 
+        # Mongo clients, one connection pool per connection string
+        self.mongo_client_registry = MongoClientRegistry(
+            max_pool_size=int(os.environ.get('MONGODB_MAX_POOL_SIZE', 100))
+        )
+
         # Database migration
         self.database_migration = DatabaseMigration(
             admin_connection_string=getenv_or_raise("MONGODB_ADMIN_CONNECTION_STRING"),
-            db=getenv_or_raise("MONGODB_DB")
+            db=getenv_or_raise("MONGODB_DB"),
+            client=self.mongo_client_registry.get(getenv_or_raise("MONGODB_ADMIN_CONNECTION_STRING"), "migration")
         )
 
         # Work factory
         self.content_store = ContentStore(
             connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
-            db=getenv_or_raise("MONGODB_DB")
+            db=getenv_or_raise("MONGODB_DB"),
+            client=self._get_mongo_client("content")
         )
+        query_cache = self._build_query_cache()
+        self.query_cache = query_cache
+        if query_cache:
+            # the public api reads through the cache, writes through either content store invalidate it
+            self.api_content_store = ContentStore(
+                connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
+                db=getenv_or_raise("MONGODB_DB"),
+                query_cache=query_cache,
+                client=self._get_mongo_client("api_content")
+            )
+            self.content_store.add_write_listener(lambda document_ids, inserted: query_cache.bump_generation())
+        else:
+            self.api_content_store = self.content_store
         metadata_store_factory = MetadataStoreFactory(
             connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
             db=getenv_or_raise("MONGODB_DB"),
+            client=self._get_mongo_client("worker_metadata"),
+            optimistic=os.environ.get('WORKER_METADATA_OPTIMISTIC', 'false') == 'true'
         )
         self.worker_context_factory = WorkContextFactory(self.content_store, metadata_store_factory)
         self.worker_cache = WorkerCache()
         self.worker_config_store = WorkerConfigStore(
             connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
             db=getenv_or_raise("MONGODB_DB"),
-            worker_cache=self.worker_cache
+            worker_cache=self.worker_cache,
+            client=self._get_mongo_client("worker_config")
+        )
+        self.worker_pool = WorkerPool(
+            worker_cache=self.worker_cache,
+            max_size=int(os.environ.get('WORKER_POOL_MAX_SIZE', 100)),
+            idle_seconds=int(os.environ.get('WORKER_POOL_IDLE_SECONDS', 3600))
         )
         self.work_factory = WorkFactory(
             work_context_factory=self.worker_context_factory,
             worker_cache=self.worker_cache,
             worker_config_store=self.worker_config_store,
             sentry_enabled=sentry_enabled,
+            worker_pool=self.worker_pool,
         )
 
         # Objects
         self.default_api_handler = None  # type: Optional[ApiHandler]
         self.mod_view_store = ModViewStore()
-        self.boards_renderer = ModViewRenderer(self.content_store)
+        self.boards_renderer = ModViewRenderer(
+            content_store=self.content_store,
+            threads=int(os.environ.get('MOD_VIEW_RENDER_THREADS', 0)),
+            column_timeout_seconds=float(os.environ['MOD_VIEW_COLUMN_TIMEOUT_SECONDS'])
+            if 'MOD_VIEW_COLUMN_TIMEOUT_SECONDS' in os.environ else None
+        )
+        self.boards_counter = ModViewCounter(
+            content_store=self.content_store,
+            cap=int(os.environ.get('MOD_VIEW_COUNT_CAP', 10000)),
+            ttl_seconds=int(os.environ.get('MOD_VIEW_COUNT_TTL_SECONDS', 10))
+        )
+        # callbacks write through this content store, so they drop cached counts right away
+        self.content_store.add_write_listener(lambda document_ids, inserted: self.boards_counter.invalidate())
+        # rendered boards are served until a write, the ttl bounds how late writes of other processes show up
+        self.board_render_cache = InMemoryQueryCache(
+            ttl_seconds=int(os.environ.get('MOD_VIEW_RENDER_CACHE_TTL_SECONDS', 10)),
+            max_size=int(os.environ.get('MOD_VIEW_RENDER_CACHE_MAX_SIZE', 100))
+        )
+        self.content_store.add_write_listener(lambda document_ids, inserted: self.board_render_cache.bump_generation())
+        # open boards follow writes made through this process, see /apiInternal/boardEvents
+        self.content_notifier = ContentNotifier()
+        # a board event stream holds a web worker thread, it ends after this long and the browser reconnects
+        self.board_events_max_seconds = int(os.environ.get('MOD_VIEW_EVENTS_MAX_SECONDS', 300))
+        self.content_store.add_write_listener(self.content_notifier.publish)
         self.job_runs_store = JobRunsStore(
             connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
-            db=getenv_or_raise("MONGODB_DB")
+            db=getenv_or_raise("MONGODB_DB"),
+            client=self._get_mongo_client("job_runs")
         )
         self.worker_queue = WorkerQueue(
             redis_url=getenv_or_raise("REDIS_URL"),
             key_prefix=getenv_or_raise("REDIS_KEY_PREFIX")
         )
         self.job_scheduler = JobScheduler(self.worker_queue)
+        # modules run on a thread slot unless registered otherwise, see start_worker
+        self.default_concurrency = os.environ.get('WORKER_CONCURRENCY', 'thread')
+        if self.default_concurrency not in CONCURRENCY_MODES:
+            raise RuntimeError(f"Unknown WORKER_CONCURRENCY {self.default_concurrency}")
+        self.worker_concurrency = {}  # type: Dict[str, str]
+        self.job_concurrency = {}  # type: Dict[str, str]
         self.job_factory = JobFactory(self.job_scheduler, self.content_store, self.job_runs_store)
 
-    def register_worker_module(self, module_name: str, constructor: Callable):
+        # Indexes
+        self.index_registry = IndexRegistry()
+        self.index_registry.add(WorkerConfigStore.COLLECTION_NAME, [("worker_id", 1)], unique=True)
+        self.index_registry.add(JobRunsStore.COLLECTION_NAME, [("job_id", 1)], unique=True)
+
+    def _get_mongo_client(self, role: str) -> pymongo.MongoClient:
+        return self.mongo_client_registry.get(getenv_or_raise("MONGODB_CONNECTION_STRING"), role)
+
+    @staticmethod
+    def _build_query_cache() -> Optional[QueryCache]:
+        query_cache_type = os.environ.get('QUERY_CACHE', '')
+        ttl_seconds = int(os.environ.get('QUERY_CACHE_TTL_SECONDS', 10))
+        if query_cache_type == 'memory':
+            print("Setting up in-memory query cache")
+            return InMemoryQueryCache(
+                ttl_seconds=ttl_seconds,
+                max_size=int(os.environ.get('QUERY_CACHE_MAX_SIZE', 1000))
+            )
+        if query_cache_type == 'redis':
+            print("Setting up redis query cache")
+            return RedisQueryCache(
+                redis_url=getenv_or_raise("REDIS_URL"),
+                key_prefix=getenv_or_raise("REDIS_KEY_PREFIX"),
+                ttl_seconds=ttl_seconds
+            )
+        if query_cache_type:
+            raise RuntimeError(f"Unknown QUERY_CACHE {query_cache_type}")
+        return None
+
+    def register_worker_module(self, module_name: str, constructor: Callable, concurrency: Optional[str] = None):
         self.worker_cache.register_module(module_name, constructor)
+        if concurrency:
+            self.worker_concurrency[module_name] = self._check_concurrency(concurrency)
 
-    def register_job_module(self, module_name: str, constructor: Callable):
+    def register_job_module(self, module_name: str, constructor: Callable, concurrency: Optional[str] = None):
         self.job_scheduler.register_job_module(module_name, constructor)
+        if concurrency:
+            self.job_concurrency[module_name] = self._check_concurrency(concurrency)
+
+    @staticmethod
+    def _check_concurrency(concurrency: str) -> str:
+        if concurrency not in CONCURRENCY_MODES:
+            raise RuntimeError(f"Unknown concurrency {concurrency}, expecting one of {CONCURRENCY_MODES}")
+        return concurrency
 
     def set_default_api_handler(self, constructor: Callable):
         self.default_api_handler = constructor()
@@ -91,11 +196,27 @@ class Application(object):
     def add_mod_view(self, name: str, mod_view: ModViewQuery):
         self.mod_view_store.add_mod_view(name, mod_view)
 
+    def add_hamming_index(self, binary_string_key: str, length: int, substrings: int):
+        self.content_store.add_hamming_index(binary_string_key, length, substrings)
+        self.index_registry.add(
+            ContentStore.COLLECTION_NAME,
+            [(self.content_store.hamming_indexes[binary_string_key].index_key(), 1)]
+        )
+
+    def add_packed_binary_string(self, binary_string_key: str, length: int):
+        self.content_store.add_packed_binary_string(binary_string_key, length)
+
+    def add_index(self, keys: List[Tuple[str, int]], unique: bool = False, sparse: bool = False):
+        self.index_registry.add(ContentStore.COLLECTION_NAME, keys, unique, sparse)
+
     def get_flask_app(self) -> Flask:
+        self._check_mod_view_indexes()
+
         # Other objects
         global_metadata_store = GlobalMetadataStore(
             connection_string=getenv_or_raise("MONGODB_CONNECTION_STRING"),
-            db=getenv_or_raise("MONGODB_DB")
+            db=getenv_or_raise("MONGODB_DB"),
+            client=self._get_mongo_client("global_metadata")
         )
 
         # Figure out path for static web artifact
@@ -130,7 +251,17 @@ class Application(object):
         # Configure Flask paths and handlers
         def _before_request():
             r_path = request.path
-            if r_path.startswith("/apiInternal"):
+            if r_path.startswith("/apiInternal/boardEvents/") and "jwt" in request.args:
+                # EventSource cannot send headers, so only board events take the token as ?jwt=,
+                # anywhere else it would end up in access logs for no reason
+                try:
+                    decode_token(request.args["jwt"])
+                except Exception:
+                    return jsonify({
+                        "status": "error",
+                        "message": "Invalid token"
+                    }), 401
+            elif r_path.startswith("/apiInternal"):
                 verify_jwt_in_request()
 
         flask_app.before_request(_before_request)
@@ -180,7 +311,7 @@ class Application(object):
             result = default_api_handler.handle_request(
                 path,
                 request.args.to_dict(),
-                self.content_store
+                self.api_content_store
             )
             return jsonify(result), 200
 
@@ -311,12 +442,50 @@ class Application(object):
             return jsonify(boards), 200
 
         def __render_board(board_id: str):
+            after = request.args.get("from")
+            before = None if "from" in request.args else request.args.get("to")
+            # a shared query cache also sees writes of other processes, so its generation is part of the key
+            cache_key = json.dumps([
+                board_id, after, before, self.query_cache.get_generation() if self.query_cache else 0
+            ])
+            generation = self.board_render_cache.get_generation()
+            cached = self.board_render_cache.get(cache_key, generation)
+            if cached is None:
+                board_render = __get_board_render(board_id, after, before)
+                body = json.dumps(board_render)
+                # timings differ on every render, an unchanged board keeps its etag without them
+                without_timings = {k: v for k, v in board_render.items() if k != "column_timings"}
+                etag = hashlib.sha1(json.dumps(without_timings, sort_keys=True).encode("utf-8")).hexdigest()
+                cached = (etag, body)
+                self.board_render_cache.set(cache_key, generation, cached)
+            etag, body = cached
+            if request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = Response(body, status=200, mimetype="application/json")
+            response.set_etag(etag)
+            # browsers revalidate every time and get a 304 while the board is unchanged
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        def __get_board_render(board_id: str, after: Optional[str], before: Optional[str]) -> Dict:
             board_query = self.mod_view_store.get(board_id)
-            return jsonify({
+            # "from" pages towards the end of the board and "to" pages towards its start
+            board_render = self.boards_renderer.render(board_query, after=after, before=before)
+            count_without_limit, count_without_limit_capped, count_without_limit_estimated = \
+                self.boards_counter.count(board_id, board_query.query)
+            return {
                 "board_query": board_query.to_dict(),
-                "payload": self.boards_renderer.render_as_dict(board_query),
-                "count_without_limit": self.content_store.count(board_query.query)
-            }), 200
+                "payload": board_render.rows,
+                "column_timings": board_render.column_timings_to_dict(),
+                "has_prev": board_render.has_prev,
+                "prev_to": board_render.prev_cursor,
+                "has_next": board_render.has_next,
+                "next_from": board_render.next_cursor,
+                "count_without_limit": count_without_limit,
+                "count_without_limit_capped": count_without_limit_capped,
+                "count_without_limit_estimated": count_without_limit_estimated
+            }
 
         @flask_app.route('/apiInternal/renderBoard/<string:board_id>', methods=['GET'])
         def _render_board(board_id: str):
@@ -326,7 +495,54 @@ class Application(object):
         def _callback_board(board_id: str, callback_id: str):
             document = request.json  # type: Dict
             self.boards_renderer.callback(callback_id, document)
-            return __render_board(board_id)
+            if request.args.get("full") == "true" or "_id" not in document:
+                return __render_board(board_id)
+            # only the clicked row is re-rendered, the client patches it into the board
+            board_query = self.mod_view_store.get(board_id)
+            return jsonify(self.boards_renderer.render_patch(board_query, [document["_id"]]).to_dict()), 200
+
+        @flask_app.route('/apiInternal/callbackBoardBatch/<string:board_id>/<string:callback_id>', methods=['POST'])
+        def _callback_board_batch(board_id: str, callback_id: str):
+            documents = request.json  # type: List[Dict]
+            self.boards_renderer.callback_batch(callback_id, documents)
+            document_ids = list(map(lambda d: d["_id"], filter(lambda d: "_id" in d, documents)))
+            if request.args.get("full") == "true" or len(document_ids) != len(documents):
+                return __render_board(board_id)
+            board_query = self.mod_view_store.get(board_id)
+            return jsonify(self.boards_renderer.render_patch(board_query, document_ids).to_dict()), 200
+
+        @flask_app.route('/apiInternal/boardEvents/<string:board_id>', methods=['GET'])
+        def _board_events(board_id: str):
+            board_query = self.mod_view_store.get(board_id)
+            subscription = self.content_notifier.subscribe()
+
+            def _events():
+                ends_at = time.time() + self.board_events_max_seconds
+                try:
+                    # EventSource reconnects this soon after the stream ends
+                    yield "retry: 1000\n\n"
+                    while time.time() < ends_at:
+                        changes = subscription.wait(timeout_seconds=min(15, max(ends_at - time.time(), 0)))
+                        if changes is None:
+                            # comments keep proxies from closing an idle stream
+                            yield ": keepalive\n\n"
+                            continue
+                        if changes.unknown:
+                            yield "event: stale\ndata: {}\n\n"
+                        if changes.document_ids:
+                            patch = self.boards_renderer.render_patch(
+                                board_query, changes.document_ids, changes.inserted_ids
+                            )
+                            yield f"event: patch\ndata: {json.dumps(patch.to_dict())}\n\n"
+                        # writes during this pause go out as one patch
+                        time.sleep(1)
+                finally:
+                    self.content_notifier.unsubscribe(subscription)
+
+            return Response(stream_with_context(_events()), mimetype="text/event-stream", headers={
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no"
+            })
 
         @flask_app.route('/web', methods=['GET'])
         @flask_app.route('/web/<path:filename>', methods=['GET'])
@@ -338,6 +554,10 @@ class Application(object):
             else:
                 return send_from_directory(web_root, "index.html")
 
+        @flask_app.route('/apiInternal/mongoStats', methods=['GET'])
+        def _mongo_stats():
+            return jsonify(self.mongo_client_registry.get_stats()), 200
+
         @flask_app.route('/apiInternal/instanceTitle', methods=['GET'])
         def _instance_title():
             return self.instance_title, 200
@@ -363,19 +583,63 @@ class Application(object):
 
     def start_worker(self):
         self.database_migration.assert_latest()
-        try:
-            while True:
-                payload = self.worker_queue.blocking_dequeue()
-                if payload.type == "worker":
-                    self._run_worker(payload)
-                elif payload.type == "job":
-                    self._run_job(payload)
+        runner = WorkerRunner(
+            worker_queue=self.worker_queue,
+            run_payload=self._run_payload,
+            get_concurrency=self._get_concurrency,
+            threads=int(os.environ.get('WORKER_THREADS', 1)),
+            processes=int(os.environ.get('WORKER_PROCESSES', 0)),
+            process_initializer=self._reset_after_fork,
+            report_seconds=int(os.environ.get('WORKER_UTILIZATION_REPORT_SECONDS', 60))
+        )
 
+        def _stop(signum, frame):
+            print('Worker stopping, waiting for running payloads...')
+            runner.stop()
+
+        # sigterm stops dequeuing and lets running payloads finish instead of killing them
+        signal.signal(signal.SIGTERM, _stop)
+        try:
+            runner.run()
         except (KeyboardInterrupt, SystemExit):
             print('Worker stopping...')
 
     def start_database_migration(self):
         self.database_migration.migrate()
+        self.database_migration.apply_indexes(self.index_registry.get_all())
+
+    def _check_mod_view_indexes(self):
+        for board_id, board_query in self.mod_view_store.get_all():
+            if not self.index_registry.is_query_indexed(ContentStore.COLLECTION_NAME, board_query.query,
+                                                        board_query.sort):
+                logger.warning(f"Mod view {board_id} is not covered by any registered index and will scan "
+                               f"{ContentStore.COLLECTION_NAME}, consider add_index")
+
+    def _run_payload(self, payload: WorkerPayload):
+        if payload.type == "worker":
+            self._run_worker(payload)
+        elif payload.type == "job":
+            self._run_job(payload)
+
+    def _get_concurrency(self, payload: WorkerPayload) -> str:
+        if payload.type == "worker":
+            return self.worker_concurrency.get(payload.module_name, self.default_concurrency)
+        return self.job_concurrency.get(payload.module_name, self.default_concurrency)
+
+    def _reset_after_fork(self):
+        # runs in every forked worker process before its first payload
+        self.mongo_client_registry.reset()
+        for store, role in [(self.content_store, "content"), (self.worker_config_store, "worker_config"),
+                            (self.job_runs_store, "job_runs")]:
+            store.client = self._get_mongo_client(role)
+            store.db = store.client[store.db.name]
+            store.collection = store.db[store.collection.name]
+        self.worker_context_factory.metadata_store_factory.client = self._get_mongo_client("worker_metadata")
+        self.worker_pool.reset()
+        # the parent's sigterm handler would stop a runner that does not exist here, and ctrl-c reaches the
+        # whole process group, the parent shuts the pool down once running payloads finish
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
 
     def _run_worker(self, payload: WorkerPayload):
         module_name, args = payload.module_name, payload.args
@@ -1 +1,8 @@
 from .content_store import ContentStore
+from .hamming_index import HammingIndex
+from .packed_binary_string import PackedBinaryString
+from .append_result import AppendResult
+from .bulk_operation import BulkOperation, BulkUpdateResult
+from .query_cache import QueryCache, InMemoryQueryCache, RedisQueryCache
+from .query_page import QueryPage
+from .content_notifier import ContentNotifier, ContentSubscription, ContentChanges
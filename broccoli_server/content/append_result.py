@@ -0,0 +1,12 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class AppendResult:
+    inserted: int = 0
+    skipped_missing_key: int = 0
+    skipped_in_persistence: int = 0
+    skipped_in_batch: int = 0
+
+    def skipped(self) -> int:
+        return self.skipped_missing_key + self.skipped_in_persistence + self.skipped_in_batch
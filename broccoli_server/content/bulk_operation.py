@@ -0,0 +1,32 @@
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class BulkOperation:
+    type: str
+    filter_q: Dict
+    update_doc: Optional[Dict] = None
+
+    @staticmethod
+    def update_one(filter_q: Dict, update_doc: Dict):
+        return BulkOperation("update_one", filter_q, update_doc)
+
+    @staticmethod
+    def update_many(filter_q: Dict, update_doc: Dict):
+        return BulkOperation("update_many", filter_q, update_doc)
+
+    @staticmethod
+    def delete_one(filter_q: Dict):
+        return BulkOperation("delete_one", filter_q)
+
+    @staticmethod
+    def delete_many(filter_q: Dict):
+        return BulkOperation("delete_many", filter_q)
+
+
+@dataclass
+class BulkUpdateResult:
+    matched: int = 0
+    modified: int = 0
+    deleted: int = 0
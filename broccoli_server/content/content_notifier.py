@@ -0,0 +1,77 @@
+import threading
+from dataclasses import dataclass, field
+from typing import List, Optional, Set
+
+
+@dataclass
+class ContentChanges:
+    document_ids: List[str]
+    # the subset of document_ids that did not exist before
+    inserted_ids: List[str] = field(default_factory=list)
+    # some writes do not know which documents they touched
+    unknown: bool = False
+
+
+class ContentSubscription(object):
+    def __init__(self, max_document_ids: int):
+        self.max_document_ids = max_document_ids
+        self.lock = threading.Lock()
+        self.event = threading.Event()
+        self.document_ids = set()  # type: Set[str]
+        self.inserted_ids = set()  # type: Set[str]
+        self.unknown = False
+
+    def add(self, document_ids: Optional[List[str]], inserted: bool = False):
+        with self.lock:
+            if document_ids is None:
+                self.unknown = True
+            else:
+                self.document_ids.update(document_ids)
+                if inserted:
+                    self.inserted_ids.update(document_ids)
+            # a subscriber this far behind reloads anyway
+            if len(self.document_ids) > self.max_document_ids:
+                self.document_ids.clear()
+                self.inserted_ids.clear()
+                self.unknown = True
+        self.event.set()
+
+    def wait(self, timeout_seconds: float) -> Optional[ContentChanges]:
+        # changes that piled up while waiting come back together
+        if not self.event.wait(timeout_seconds):
+            return None
+        with self.lock:
+            self.event.clear()
+            changes = ContentChanges(
+                document_ids=sorted(self.document_ids),
+                inserted_ids=sorted(self.inserted_ids),
+                unknown=self.unknown
+            )
+            self.document_ids = set()
+            self.inserted_ids = set()
+            self.unknown = False
+        return changes
+
+
+class ContentNotifier(object):
+    def __init__(self, max_document_ids: int = 1000):
+        self.max_document_ids = max_document_ids
+        self.lock = threading.Lock()
+        self.subscriptions = []  # type: List[ContentSubscription]
+
+    def subscribe(self) -> ContentSubscription:
+        subscription = ContentSubscription(self.max_document_ids)
+        with self.lock:
+            self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: ContentSubscription):
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, document_ids: Optional[List[str]], inserted: bool = False):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.add(document_ids, inserted)
@@ -1,10 +1,19 @@
+import bson
 import pymongo
-import random
+import numpy as np
 import heapq
 import logging
 from functools import total_ordering
-from typing import Dict, List, Optional
+from bson import json_util
+from typing import Callable, Dict, List, Optional, Tuple, Iterator, Union
 from broccoli_server.utils import milliseconds_to_datetime
+from .hamming_index import HammingIndex, MAX_PROBE_TOKENS
+from .packed_binary_string import PackedBinaryString
+from .append_result import AppendResult
+from .bulk_operation import BulkOperation, BulkUpdateResult
+from .query_cache import QueryCache
+from .query_page import QueryPage
+from . import keyset
 
 logger = logging.getLogger(__name__)
 
@@ -26,10 +35,129 @@ class ComparableQueryResult(object):
 
 
 class ContentStore(object):
-    def __init__(self, connection_string: str, db: str):
-        self.client = pymongo.MongoClient(connection_string)
+    COLLECTION_NAME = 'repo.default'
+
+    def __init__(self, connection_string: str, db: str, query_cache: Optional[QueryCache] = None,
+                 client: Optional[pymongo.MongoClient] = None):
+        self.client = client if client else pymongo.MongoClient(connection_string)
         self.db = self.client[db]
-        self.collection = self.db['repo.default']
+        self.collection = self.db[ContentStore.COLLECTION_NAME]
+        self.query_cache = query_cache
+        self.write_listeners = []  # type: List[Callable[[Optional[List[str]], bool], None]]
+        self.hamming_indexes = {}  # type: Dict[str, HammingIndex]
+        self.packed_binary_strings = {}  # type: Dict[str, PackedBinaryString]
+
+    def add_hamming_index(self, binary_string_key: str, length: int, substrings: int):
+        if substrings <= 0 or substrings > length:
+            raise RuntimeError(f"Hamming index on {binary_string_key} needs between 1 and {length} substrings")
+        self.hamming_indexes[binary_string_key] = HammingIndex(binary_string_key, length, substrings)
+
+    def build_hamming_index(self, binary_string_key: str, batch_size: int = 1000) -> int:
+        if binary_string_key not in self.hamming_indexes:
+            raise RuntimeError(f"Hamming index on {binary_string_key} is not registered")
+        self.collection.create_index(self.hamming_indexes[binary_string_key].index_key())
+        return self._backfill_binary_string_fields(binary_string_key, batch_size)
+
+    def add_packed_binary_string(self, binary_string_key: str, length: int):
+        if length <= 0:
+            raise RuntimeError(f"Packed binary string on {binary_string_key} needs a positive length")
+        self.packed_binary_strings[binary_string_key] = PackedBinaryString(binary_string_key, length)
+
+    def add_write_listener(self, listener: Callable[[Optional[List[str]], bool], None]):
+        # listeners get the ids of the written documents, or None when a write does not know them,
+        # and whether those documents were just inserted
+        self.write_listeners.append(listener)
+
+    def _notify_write(self, document_ids: Optional[List[str]] = None, inserted: bool = False):
+        if self.query_cache:
+            self.query_cache.bump_generation()
+        for listener in self.write_listeners:
+            listener(document_ids, inserted)
+
+    def build_packed_binary_string(self, binary_string_key: str, batch_size: int = 1000) -> int:
+        if binary_string_key not in self.packed_binary_strings:
+            raise RuntimeError(f"Packed binary string on {binary_string_key} is not registered")
+        return self._backfill_binary_string_fields(binary_string_key, batch_size)
+
+    def _backfill_binary_string_fields(self, binary_string_key: str, batch_size: int) -> int:
+        updated_count = 0
+        requests = []
+        cursor = self.collection.find({binary_string_key: {"$exists": True}}, projection=[binary_string_key])
+        for document in cursor:
+            binary_string = document[binary_string_key]
+            if isinstance(binary_string, str) and ContentStore._check_if_string_is_binary(binary_string):
+                set_doc, unset_doc = self._get_binary_string_fields(binary_string_key, binary_string)
+            else:
+                set_doc, unset_doc = self._get_binary_string_fields(binary_string_key, "")
+            update_doc = {}
+            if set_doc:
+                update_doc["$set"] = set_doc
+                updated_count += 1
+            if unset_doc:
+                update_doc["$unset"] = unset_doc
+            if update_doc:
+                requests.append(pymongo.UpdateOne({"_id": document["_id"]}, update_doc))
+            if len(requests) >= batch_size:
+                self.collection.bulk_write(requests, ordered=False)
+                requests = []
+        if requests:
+            self.collection.bulk_write(requests, ordered=False)
+        self._notify_write()
+        return updated_count
+
+    def _get_binary_string_fields(self, binary_string_key: str, binary_string: str) -> Tuple[Dict, Dict]:
+        set_doc, unset_doc = {}, {}
+        if binary_string_key in self.hamming_indexes:
+            index = self.hamming_indexes[binary_string_key]
+            if len(binary_string) == index.length:
+                set_doc[index.index_key()] = index.tokens(binary_string)
+            else:
+                unset_doc[index.index_key()] = ""
+        if binary_string_key in self.packed_binary_strings:
+            packed = self.packed_binary_strings[binary_string_key]
+            if len(binary_string) == packed.length:
+                set_doc[packed.packed_key()] = packed.pack(binary_string)
+            else:
+                unset_doc[packed.packed_key()] = ""
+        return set_doc, unset_doc
+
+    def _with_binary_string_fields(self, doc: Dict) -> Dict:
+        # documents stored with a registered binary string get its index tokens and packed form right away,
+        # otherwise they would be missing from index and packed queries until the next backfill
+        derived = {}
+        for binary_string_key in self._get_binary_string_keys():
+            binary_string = doc.get(binary_string_key)
+            if isinstance(binary_string, str) and ContentStore._check_if_string_is_binary(binary_string):
+                set_doc, _ = self._get_binary_string_fields(binary_string_key, binary_string)
+                derived.update(set_doc)
+        if not derived:
+            return doc
+        return {**doc, **derived}
+
+    def _with_binary_string_update(self, update_doc: Dict) -> Dict:
+        set_doc, unset_doc = {}, {}
+        for binary_string_key in self._get_binary_string_keys():
+            if binary_string_key in update_doc.get("$set", {}):
+                binary_string = update_doc["$set"][binary_string_key]
+                if not isinstance(binary_string, str) or not ContentStore._check_if_string_is_binary(binary_string):
+                    binary_string = ""
+                key_set_doc, key_unset_doc = self._get_binary_string_fields(binary_string_key, binary_string)
+                set_doc.update(key_set_doc)
+                unset_doc.update(key_unset_doc)
+            elif binary_string_key in update_doc.get("$unset", {}):
+                _, key_unset_doc = self._get_binary_string_fields(binary_string_key, "")
+                unset_doc.update(key_unset_doc)
+        if not set_doc and not unset_doc:
+            return update_doc
+        update_doc = dict(update_doc)
+        if set_doc:
+            update_doc["$set"] = {**update_doc.get("$set", {}), **set_doc}
+        if unset_doc:
+            update_doc["$unset"] = {**update_doc.get("$unset", {}), **unset_doc}
+        return update_doc
+
+    def _get_binary_string_keys(self) -> List[str]:
+        return list(set(self.hamming_indexes.keys()) | set(self.packed_binary_strings.keys()))
 
     def append(self, doc: Dict, idempotency_key: str):
         if idempotency_key not in doc:
@@ -45,9 +173,11 @@ class ContentStore(object):
             logger.info(f"Document with {idempotency_key}={idempotency_value} is already present")
             return
 
-        self.collection.insert_one(doc)
+        inserted_id = self.collection.insert_one(self._with_binary_string_fields(doc)).inserted_id
+        self._notify_write([str(inserted_id)], inserted=True)
 
-    def append_multiple(self, docs: List[Dict], idempotency_key: str):
+    def append_multiple(self, docs: List[Dict], idempotency_key: str) -> AppendResult:
+        result = AppendResult()
         keyed_docs = []
         for doc in docs:
             if idempotency_key not in doc:
@@ -55,44 +185,89 @@ class ContentStore(object):
                     'idempotency_key': idempotency_key,
                     'payload': doc
                 })
+                result.skipped_missing_key += 1
             else:
                 keyed_docs.append(doc)
 
+        # scalar values are looked up in one query, lists and dicts match arrays by element in mongo
+        # so they keep being checked one by one
+        scalar_values = list(filter(
+            lambda v: not isinstance(v, (list, dict)),
+            map(lambda d: d[idempotency_key], keyed_docs)
+        ))
+        existing_values = set()
+        if scalar_values:
+            cursor = self.collection.find(
+                {idempotency_key: {"$in": scalar_values}},
+                projection={idempotency_key: 1, "_id": 0}
+            )
+            for existing_doc in cursor:
+                existing_value = existing_doc[idempotency_key]
+                if isinstance(existing_value, list):
+                    # a scalar matched one of the array's elements
+                    existing_values.update(filter(lambda v: not isinstance(v, (list, dict)), existing_value))
+                elif not isinstance(existing_value, dict):
+                    existing_values.add(existing_value)
+
         idempotent_docs = []
+        batch_values = set()
         for doc in keyed_docs:
             idempotency_value = doc[idempotency_key]
-            existing_doc_count = self.collection.count_documents({idempotency_key: idempotency_value})
-            if existing_doc_count != 0:
+            if isinstance(idempotency_value, (list, dict)):
+                is_existing = self.collection.count_documents({idempotency_key: idempotency_value}) != 0
+                batch_value = ("json", json_util.dumps(idempotency_value))
+            else:
+                is_existing = idempotency_value in existing_values
+                batch_value = idempotency_value
+            if is_existing:
                 logger.info(f"Document with {idempotency_key}={idempotency_value} is already present in persistence")
+                result.skipped_in_persistence += 1
                 continue
-            doc_exists_in_batch = False
-            for d in idempotent_docs:
-                if d[idempotency_key] == idempotency_value:
-                    doc_exists_in_batch = True
-                    break
-            if doc_exists_in_batch:
+            if batch_value in batch_values:
                 logger.info(f"Document with {idempotency_key}={idempotency_value} is already present in current batch")
+                result.skipped_in_batch += 1
                 continue
+            batch_values.add(batch_value)
             idempotent_docs.append(doc)
 
         if not idempotent_docs:
             logger.info("There is nothing to be appended")
-            return
+            return result
 
-        self.collection.insert_many(idempotent_docs)
+        inserted_ids = self.collection.insert_many(
+            list(map(self._with_binary_string_fields, idempotent_docs))
+        ).inserted_ids
+        self._notify_write(list(map(str, inserted_ids)), inserted=True)
+        result.inserted = len(idempotent_docs)
+        return result
 
     def query(self, q: Dict, limit: Optional[int] = None, projection: Optional[List[str]] = None,
-              sort: Optional[Dict[str, int]] = None, datetime_q: Optional[List[Dict]] = None) -> List[Dict]:
-        # Append datetime query
+              sort: Optional[Dict[str, int]] = None, datetime_q: Optional[List[Dict]] = None,
+              raw_id: bool = False) -> List[Dict]:
+        if not self.query_cache:
+            return self._query(q, limit, projection, sort, datetime_q, raw_id)
+        cache_key = ContentStore._get_cache_key("query_raw_id" if raw_id else "query", q, limit, projection, sort,
+                                                datetime_q)
+        generation = self.query_cache.get_generation()
+        res = self.query_cache.get(cache_key, generation)
+        if res is None:
+            res = self._query(q, limit, projection, sort, datetime_q, raw_id)
+            self.query_cache.set(cache_key, generation, res)
+        return res
+
+    def _query(self, q: Dict, limit: Optional[int], projection: Optional[List[str]], sort: Optional[Dict[str, int]],
+               datetime_q: Optional[List[Dict]], raw_id: bool = False) -> List[Dict]:
+        # Append datetime query, to a copy since callers reuse their query and it is also a cache key
         if datetime_q:
+            q = dict(q)
             for qd in datetime_q:
                 q[qd["key"]] = {
                     "$" + qd["op"]: milliseconds_to_datetime(qd["value"])
                 }
 
-        # Append default projections
+        # Append default projections, to a copy for the same reason
         if projection:
-            projection += ["_id"]
+            projection = list(projection) + ["_id"]
         cursor = self.collection.find(q, projection=projection)
 
         # Append limit
@@ -101,65 +276,228 @@ class ContentStore(object):
 
         # Append sort
         if sort:
-            for sort_key, sort_order in sort.items():
-                cursor = cursor.sort(sort_key, sort_order)
+            cursor = cursor.sort(list(sort.items()))
 
         res = []
         for document in cursor:
-            document["_id"] = str(document["_id"])
+            if not raw_id:
+                document["_id"] = str(document["_id"])
             res.append(document)
         return res
 
+    def query_page(self, q: Dict, sort: Dict[str, int], limit: int, projection: Optional[List[str]] = None,
+                   after: Optional[str] = None, before: Optional[str] = None) -> QueryPage:
+        sort_keys = keyset.get_sort_keys(sort)
+        reversed_sort_keys = keyset.reverse_sort_keys(sort_keys)
+        if projection:
+            projection = list(projection) + list(map(lambda k: k[0], sort_keys))
+
+        if before is not None:
+            # read backwards from the cursor, one extra row tells whether there is an earlier page
+            values = keyset.decode_cursor(before, sort_keys)
+            results = self.query(
+                q={"$and": [q, keyset.get_keyset_q(reversed_sort_keys, values)]},
+                limit=limit + 1,
+                projection=projection,
+                sort=dict(reversed_sort_keys),
+                raw_id=True
+            )
+            has_prev = len(results) > limit
+            results = list(reversed(results[:limit]))
+            has_next = bool(results) and self._exists({
+                "$and": [q, keyset.get_keyset_q(sort_keys, keyset.get_values(results[-1], sort_keys))]
+            })
+        else:
+            page_q = q
+            if after is not None:
+                values = keyset.decode_cursor(after, sort_keys)
+                page_q = {"$and": [q, keyset.get_keyset_q(sort_keys, values)]}
+            results = self.query(
+                q=page_q,
+                limit=limit + 1,
+                projection=projection,
+                sort=dict(sort_keys),
+                raw_id=True
+            )
+            has_next = len(results) > limit
+            results = results[:limit]
+            has_prev = after is not None and bool(results) and self._exists({
+                "$and": [q, keyset.get_keyset_q(reversed_sort_keys, keyset.get_values(results[0], sort_keys))]
+            })
+
+        if not results:
+            return QueryPage(results=[], has_prev=False, has_next=False)
+        # cursors keep the _id type, _id is not always an ObjectId
+        prev_cursor = keyset.encode_cursor(results[0], sort_keys)
+        next_cursor = keyset.encode_cursor(results[-1], sort_keys)
+        for document in results:
+            document["_id"] = str(document["_id"])
+        return QueryPage(
+            results=results,
+            has_prev=has_prev,
+            has_next=has_next,
+            prev_cursor=prev_cursor,
+            next_cursor=next_cursor
+        )
+
+    def _exists(self, q: Dict) -> bool:
+        return len(self.query(q, limit=1, projection=["_id"])) != 0
+
+    def iter_query(self, q: Dict, projection: Optional[List[str]] = None, batch_size: int = 1000,
+                   raw_id: bool = False, start_after_id: Optional[Union[str, bson.ObjectId]] = None) -> Iterator[Dict]:
+        # walk the collection in _id order one short query per batch, so no cursor is held open across batches
+        # and an interrupted scan can resume from the last _id it has seen
+        if projection:
+            projection = list(projection) + ["_id"]
+        last_id = bson.ObjectId(start_after_id) if isinstance(start_after_id, str) else start_after_id
+        while True:
+            batch_q = q if last_id is None else {"$and": [q, {"_id": {"$gt": last_id}}]}
+            cursor = self.collection.find(batch_q, projection=projection).sort("_id", 1).limit(batch_size)
+            documents = list(cursor)
+            for document in documents:
+                last_id = document["_id"]
+                if not raw_id:
+                    document["_id"] = str(document["_id"])
+                yield document
+            if len(documents) < batch_size:
+                return
+
     def update_one(self, filter_q: Dict, update_doc: Dict, allow_many: bool = False):
-        existing_doc_count = self.collection.count_documents(filter_q)
-        if existing_doc_count == 0:
+        update_doc = self._with_binary_string_update(update_doc)
+        if allow_many:
+            matched_count = self.collection.update_many(filter_q, update_doc, upsert=False).matched_count
+            if matched_count != 0:
+                self._notify_write()
+            if matched_count == 0:
+                logger.error(f"Document does not exist", extra={
+                    "query": filter_q
+                })
+            elif matched_count > 1:
+                logger.error(f"More than one document is updated because of allow_many", extra={
+                    'filter_q': filter_q
+                })
+            return
+
+        # fetching at most two ids is enough to refuse ambiguous filters and is cheaper than counting
+        ids = list(map(lambda d: d["_id"], self.collection.find(filter_q, projection=["_id"]).limit(2)))
+        if not ids:
             logger.error(f"Document does not exist", extra={
                 "query": filter_q
             })
             return
-
-        more_than_one = existing_doc_count > 1
-        if more_than_one and not allow_many:
+        if len(ids) > 1:
             logger.error(f"More than one documents exist", extra={
                 "query": filter_q
             })
             return
-
-        if not more_than_one:
-            self.collection.update_one(filter_q, update_doc, upsert=False)
-            return
-
-        logger.error(f"More than one document is updated because of allow_many", extra={
-            'filter_q': filter_q
-        })
-        self.update_many(filter_q, update_doc)
+        self.collection.update_one({"_id": ids[0]}, update_doc, upsert=False)
+        self._notify_write([str(ids[0])])
 
     def update_many(self, filter_q: Dict, update_doc: Dict):
-        existing_doc_count = self.collection.count_documents(filter_q)
-        if existing_doc_count == 0:
+        update_doc = self._with_binary_string_update(update_doc)
+        matched_count = self.collection.update_many(filter_q, update_doc, upsert=False).matched_count
+        if matched_count == 0:
             logger.error(f"Document does not exist", extra={
                 "query": filter_q
             })
             return
-
-        self.collection.update_many(filter_q, update_doc, upsert=False)
-
-    def random_one(self, q: Dict, projection: List[str]) -> Dict:
-        documents = self.query(q, projection=projection)
-        random_index = random.randint(0, len(documents) - 1)
-        return documents[random_index]
+        self._notify_write()
+
+    def bulk_update(self, operations: List[BulkOperation], ordered: bool = False) -> BulkUpdateResult:
+        requests = []
+        for operation in operations:
+            if operation.type == "update_one":
+                requests.append(pymongo.UpdateOne(
+                    operation.filter_q, self._with_binary_string_update(operation.update_doc), upsert=False
+                ))
+            elif operation.type == "update_many":
+                requests.append(pymongo.UpdateMany(
+                    operation.filter_q, self._with_binary_string_update(operation.update_doc), upsert=False
+                ))
+            elif operation.type == "delete_one":
+                requests.append(pymongo.DeleteOne(operation.filter_q))
+            elif operation.type == "delete_many":
+                requests.append(pymongo.DeleteMany(operation.filter_q))
+            else:
+                logger.error(f"Unknown bulk operation type {operation.type}", extra={
+                    "filter_q": operation.filter_q
+                })
+        if not requests:
+            return BulkUpdateResult()
+        result = self.collection.bulk_write(requests, ordered=ordered)
+        self._notify_write()
+        return BulkUpdateResult(
+            matched=result.matched_count,
+            modified=result.modified_count,
+            deleted=result.deleted_count
+        )
+
+    def random_one(self, q: Dict, projection: Optional[List[str]] = None) -> Optional[Dict]:
+        documents = self.random_many(q, 1, projection=projection)
+        if not documents:
+            return None
+        return documents[0]
+
+    def random_many(self, q: Dict, n: int, projection: Optional[List[str]] = None) -> List[Dict]:
+        if n <= 0:
+            return []
+        pipeline = [
+            {"$match": q},
+            {"$sample": {"size": n}}
+        ]
+        if projection:
+            pipeline.append({"$project": {p: 1 for p in projection}})
+        return self._aggregate(pipeline)
 
     def count(self, q: Dict, datetime_q: Optional[List[Dict]] = None) -> int:
-        # Append datetime query
+        if not self.query_cache:
+            return self._count(q, datetime_q)
+        cache_key = ContentStore._get_cache_key("count", q, datetime_q)
+        generation = self.query_cache.get_generation()
+        res = self.query_cache.get(cache_key, generation)
+        if res is None:
+            res = self._count(q, datetime_q)
+            self.query_cache.set(cache_key, generation, res)
+        return res
+
+    def _count(self, q: Dict, datetime_q: Optional[List[Dict]]) -> int:
+        # Append datetime query, to a copy since callers reuse their query and it is also a cache key
         if datetime_q:
+            q = dict(q)
             for qd in datetime_q:
                 q[qd["key"]] = {
                     "$" + qd["op"]: milliseconds_to_datetime(qd["value"])
                 }
         return self.collection.count_documents(q)
 
+    def count_capped(self, q: Dict, cap: int) -> Tuple[int, bool, bool]:
+        # returns the count, whether it stopped at cap and whether it is an estimate
+        if not q:
+            # collection metadata, no scan needed, but it can drift e.g. after an unclean shutdown or on sharded clusters
+            return self.collection.estimated_document_count(), False, True
+        count = self.collection.count_documents(q, limit=cap + 1)
+        if count > cap:
+            return cap, True, False
+        return count, False, False
+
     def delete_many(self, q: Dict) -> int:
-        return self.collection.delete_many(q).deleted_count
+        deleted_count = self.collection.delete_many(q).deleted_count
+        if deleted_count != 0:
+            self._notify_write()
+        return deleted_count
+
+    @staticmethod
+    def _get_cache_key(name: str, q: Dict, limit: Optional[int] = None, projection: Optional[List[str]] = None,
+                       sort: Optional[Dict[str, int]] = None, datetime_q: Optional[List[Dict]] = None) -> str:
+        # sort order is meaningful so it is kept as a list while everything else is normalized
+        return json_util.dumps({
+            "name": name,
+            "q": q,
+            "limit": limit,
+            "projection": sorted(projection) if projection else None,
+            "sort": list(sort.items()) if sort else None,
+            "datetime_q": datetime_q
+        }, sort_keys=True)
 
     def update_one_binary_string(self, filter_q: Dict, key: str, binary_string: str):
         if not ContentStore._check_if_string_is_binary(binary_string):
@@ -168,19 +506,38 @@ class ContentStore(object):
             })
             return
         # todo: should not update an existing field
-        self.update_one(filter_q, {
+        update_doc = {
             "$set": {
                 key: binary_string
             }
-        })
+        }
+        set_doc, unset_doc = self._get_binary_string_fields(key, binary_string)
+        update_doc["$set"].update(set_doc)
+        if unset_doc:
+            logger.warning(f"binary_string has an unexpected length for its index or packed form", extra={
+                "value": binary_string
+            })
+            update_doc["$unset"] = unset_doc
+        self.update_one(filter_q, update_doc)
 
     def query_nearest_hamming_neighbors(self, q: Dict, binary_string_key: str, from_binary_string: str,
                                         max_distance: int) -> List[Dict]:
-        # todo: use a metric tree
         if not ContentStore._check_if_string_is_binary(from_binary_string):
             return []
+        q_results = None
+        index = self._get_hamming_index(binary_string_key, from_binary_string)
+        if index:
+            substring_radius = max_distance // index.substrings
+            probe_radii = range(substring_radius + 1)
+            if sum(map(index.probe_token_count, probe_radii)) <= MAX_PROBE_TOKENS:
+                q_results = self._query_hamming_index(q, index, from_binary_string, probe_radii)
+        packed = self._get_packed_binary_string(binary_string_key, from_binary_string)
+        if q_results is None and packed:
+            q_results = self._query_packed_hamming_neighbors(q, packed, from_binary_string, max_distance=max_distance)
+        if q_results is None:
+            q_results = self.query(q, limit=None)
         results = []
-        for q_result in self.query(q, limit=None):
+        for q_result in q_results:
             if not ContentStore._check_if_q_result_has_valid_binary(q_result, binary_string_key, from_binary_string):
                 continue
             q_binary_string = q_result[binary_string_key]
@@ -191,15 +548,177 @@ class ContentStore(object):
 
     def query_n_nearest_hamming_neighbors(self, q: Dict, binary_string_key: str, from_binary_string: str,
                                           pick_n: int) -> List[Dict]:
-        # todo: use a metric tree
         if not ContentStore._check_if_string_is_binary(from_binary_string):
             logger.error(f"from_binary_string is not a 01 string", extra={
                 "value": from_binary_string
             })
             return []
+
+        index = self._get_hamming_index(binary_string_key, from_binary_string)
+        if index:
+            # widen the probe one substring radius at a time until pick_n neighbors are guaranteed
+            q_results_by_id = {}
+            probe_token_count = 0
+            for substring_radius in range(index.length // index.substrings + 1):
+                probe_token_count += index.probe_token_count(substring_radius)
+                if probe_token_count > MAX_PROBE_TOKENS:
+                    break
+                for q_result in self._query_hamming_index(q, index, from_binary_string, [substring_radius]):
+                    q_results_by_id[q_result["_id"]] = q_result
+                guaranteed_distance = index.guaranteed_distance(substring_radius)
+                if guaranteed_distance >= index.length:
+                    break
+                guaranteed_count = 0
+                for q_result in q_results_by_id.values():
+                    if ContentStore._check_if_q_result_has_valid_binary(q_result, binary_string_key,
+                                                                        from_binary_string) \
+                            and ContentStore._compute_binary_hamming_distance(
+                                q_result[binary_string_key], from_binary_string) <= guaranteed_distance:
+                        guaranteed_count += 1
+                if guaranteed_count >= pick_n:
+                    return ContentStore._pick_n_nearest(
+                        list(q_results_by_id.values()), binary_string_key, from_binary_string, pick_n
+                    )
+
+        packed = self._get_packed_binary_string(binary_string_key, from_binary_string)
+        if packed:
+            q_results = self._query_packed_hamming_neighbors(q, packed, from_binary_string, pick_n=pick_n)
+            if q_results is not None:
+                return ContentStore._pick_n_nearest(q_results, binary_string_key, from_binary_string, pick_n)
+
         q_results = self.query(q, limit=None)
         if len(q_results) < pick_n:
             return []
+        return ContentStore._pick_n_nearest(q_results, binary_string_key, from_binary_string, pick_n)
+
+    def aggregate_nearest_hamming_neighbors(self, q: Dict, binary_string_key: str, from_binary_string: str,
+                                            max_distance: int, projection: Optional[List[str]] = None,
+                                            distance_key: str = "hamming_distance") -> List[Dict]:
+        if not ContentStore._check_if_string_is_binary(from_binary_string):
+            return []
+        pipeline = self._get_hamming_pipeline(q, binary_string_key, from_binary_string, projection, distance_key)
+        pipeline.append({"$match": {distance_key: {"$lte": max_distance}}})
+        return self._aggregate(pipeline)
+
+    def aggregate_n_nearest_hamming_neighbors(self, q: Dict, binary_string_key: str, from_binary_string: str,
+                                              pick_n: int, projection: Optional[List[str]] = None,
+                                              distance_key: str = "hamming_distance") -> List[Dict]:
+        if not ContentStore._check_if_string_is_binary(from_binary_string):
+            logger.error(f"from_binary_string is not a 01 string", extra={
+                "value": from_binary_string
+            })
+            return []
+        if pick_n <= 0:
+            return []
+        pipeline = self._get_hamming_pipeline(q, binary_string_key, from_binary_string, projection, distance_key)
+        pipeline += [
+            {"$sort": {distance_key: 1, "_id": 1}},
+            {"$limit": pick_n}
+        ]
+        results = self._aggregate(pipeline)
+        if len(results) < pick_n:
+            return []
+        return results
+
+    @staticmethod
+    def _get_hamming_pipeline(q: Dict, binary_string_key: str, from_binary_string: str,
+                              projection: Optional[List[str]], distance_key: str) -> List[Dict]:
+        # mongo has no popcount operator so the distance is summed over the 01 string one byte at a time
+        mismatches = []
+        for i, c in enumerate(from_binary_string):
+            mismatches.append({
+                "$cond": [{"$eq": [{"$substr": ["$" + binary_string_key, i, 1]}, c]}, 0, 1]
+            })
+        distance = {"$add": mismatches} if mismatches else {"$literal": 0}
+
+        pipeline = [{
+            "$match": {
+                "$and": [q, {binary_string_key: {"$regex": f"^[01]{{{len(from_binary_string)}}}$"}}]
+            }
+        }]
+        if projection:
+            project = {p: 1 for p in projection}
+            project[distance_key] = distance
+            pipeline.append({"$project": project})
+        else:
+            pipeline.append({"$addFields": {distance_key: distance}})
+        return pipeline
+
+    def _aggregate(self, pipeline: List[Dict]) -> List[Dict]:
+        res = []
+        for document in self.collection.aggregate(pipeline):
+            document["_id"] = str(document["_id"])
+            res.append(document)
+        return res
+
+    def _get_hamming_index(self, binary_string_key: str, from_binary_string: str) -> Optional[HammingIndex]:
+        if binary_string_key not in self.hamming_indexes:
+            return None
+        index = self.hamming_indexes[binary_string_key]
+        if len(from_binary_string) != index.length:
+            return None
+        return index
+
+    def _query_hamming_index(self, q: Dict, index: HammingIndex, from_binary_string: str,
+                             substring_radii) -> List[Dict]:
+        tokens = []
+        for substring_radius in substring_radii:
+            tokens += index.probe_tokens(from_binary_string, substring_radius)
+        return self.query({
+            "$and": [q, {index.index_key(): {"$in": tokens}}]
+        }, limit=None)
+
+    def _get_packed_binary_string(self, binary_string_key: str,
+                                  from_binary_string: str) -> Optional[PackedBinaryString]:
+        if binary_string_key not in self.packed_binary_strings:
+            return None
+        packed = self.packed_binary_strings[binary_string_key]
+        if len(from_binary_string) != packed.length:
+            return None
+        return packed
+
+    def _query_packed_hamming_neighbors(self, q: Dict, packed: PackedBinaryString, from_binary_string: str,
+                                        max_distance: Optional[int] = None, pick_n: Optional[int] = None,
+                                        batch_size: int = 10000) -> Optional[List[Dict]]:
+        # scan only the packed field, then fetch the full documents of the neighbors
+        from_packed_string = packed.pack(from_binary_string)
+        cursor = self.collection.find(
+            {"$and": [q, {packed.packed_key(): {"$exists": True}}]},
+            projection=[packed.packed_key()],
+            batch_size=batch_size
+        )
+        ids, distances = [], []
+        batch_ids, batch_packed_strings = [], []
+        for document in cursor:
+            packed_string = document[packed.packed_key()]
+            if len(packed_string) != len(from_packed_string):
+                continue
+            batch_ids.append(document["_id"])
+            batch_packed_strings.append(packed_string)
+            if len(batch_ids) >= batch_size:
+                ids += batch_ids
+                distances.append(packed.hamming_distances(batch_packed_strings, from_packed_string))
+                batch_ids, batch_packed_strings = [], []
+        if batch_ids:
+            ids += batch_ids
+            distances.append(packed.hamming_distances(batch_packed_strings, from_packed_string))
+        all_distances = np.concatenate(distances) if distances else np.array([], dtype=np.int64)
+
+        if max_distance is not None:
+            neighbor_indexes = np.flatnonzero(all_distances <= max_distance)
+        else:
+            if len(ids) < pick_n:
+                return None
+            neighbor_indexes = np.argpartition(all_distances, pick_n - 1)[:pick_n] if pick_n > 0 else []
+        if len(neighbor_indexes) == 0:
+            return []
+        return self.query({
+            "$and": [q, {"_id": {"$in": [ids[i] for i in neighbor_indexes]}}]
+        }, limit=None)
+
+    @staticmethod
+    def _pick_n_nearest(q_results: List[Dict], binary_string_key: str, from_binary_string: str,
+                        pick_n: int) -> List[Dict]:
         results = []
         heapq.heapify(results)
         for q_result in q_results:
@@ -214,15 +733,15 @@ class ContentStore(object):
 
     @staticmethod
     def _check_if_string_is_binary(string: str) -> bool:
-        if not (set(string) <= set("01")):
-            return False
-        return True
+        return not string.strip("01")
 
     @staticmethod
     def _check_if_q_result_has_valid_binary(q_result: Dict, binary_string_key: str, from_binary_string: str) -> bool:
         if binary_string_key not in q_result:
             return False
         q_binary_string = q_result[binary_string_key]
+        if not isinstance(q_binary_string, str):
+            return False
         if len(q_binary_string) != len(from_binary_string):
             return False
         if not ContentStore._check_if_string_is_binary(q_binary_string):
@@ -231,9 +750,7 @@ class ContentStore(object):
 
     @staticmethod
     def _compute_binary_hamming_distance(s1: str, s2: str):
-        distance = 0
-        for i in range(len(s1)):
-            if s1[i] != s2[i]:
-                distance += 1
-        return distance
+        if not s1:
+            return 0
+        return bin(int(s1, 2) ^ int(s2, 2)).count("1")
 
@@ -0,0 +1,53 @@
+import itertools
+from math import factorial
+from dataclasses import dataclass
+from typing import List, Tuple
+
+# probing more tokens than this is usually slower than scanning
+MAX_PROBE_TOKENS = 4096
+
+
+@dataclass
+class HammingIndex:
+    binary_string_key: str
+    length: int
+    substrings: int
+
+    def index_key(self) -> str:
+        return f"{self.binary_string_key}_mih"
+
+    def substring_bounds(self) -> List[Tuple[int, int]]:
+        bounds = []
+        for i in range(self.substrings):
+            bounds.append((i * self.length // self.substrings, (i + 1) * self.length // self.substrings))
+        return bounds
+
+    def tokens(self, binary_string: str) -> List[str]:
+        tokens = []
+        for i, (start, end) in enumerate(self.substring_bounds()):
+            tokens.append(f"{i}:{binary_string[start:end]}")
+        return tokens
+
+    def probe_tokens(self, binary_string: str, substring_radius: int) -> List[str]:
+        # all tokens exactly substring_radius bits away from the tokens of binary_string
+        tokens = []
+        for i, (start, end) in enumerate(self.substring_bounds()):
+            substring = binary_string[start:end]
+            for positions in itertools.combinations(range(end - start), substring_radius):
+                flipped = list(substring)
+                for p in positions:
+                    flipped[p] = "1" if flipped[p] == "0" else "0"
+                tokens.append(f"{i}:{''.join(flipped)}")
+        return tokens
+
+    def probe_token_count(self, substring_radius: int) -> int:
+        count = 0
+        for start, end in self.substring_bounds():
+            n = end - start
+            if substring_radius <= n:
+                count += factorial(n) // (factorial(substring_radius) * factorial(n - substring_radius))
+        return count
+
+    def guaranteed_distance(self, substring_radius: int) -> int:
+        # by pigeonhole, a document within this distance has one substring within substring_radius
+        return (substring_radius + 1) * self.substrings - 1
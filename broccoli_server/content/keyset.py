@@ -0,0 +1,70 @@
+import base64
+from bson import json_util, ObjectId
+from typing import Any, Dict, List, Tuple
+
+
+def get_sort_keys(sort: Dict[str, int]) -> List[Tuple[str, int]]:
+    # _id breaks ties so that every document has a distinct position
+    sort_keys = list(sort.items())
+    if "_id" not in sort:
+        sort_keys.append(("_id", sort_keys[-1][1] if sort_keys else -1))
+    return sort_keys
+
+
+def reverse_sort_keys(sort_keys: List[Tuple[str, int]]) -> List[Tuple[str, int]]:
+    return list(map(lambda k: (k[0], -k[1]), sort_keys))
+
+
+def encode_cursor(document: Dict, sort_keys: List[Tuple[str, int]]) -> str:
+    if sort_keys == [("_id", sort_keys[0][1])] and isinstance(document["_id"], ObjectId):
+        # a plain ObjectId is its own cursor, which keeps _id cursors readable and stable
+        return str(document["_id"])
+    values = get_values(document, sort_keys)
+    return base64.urlsafe_b64encode(json_util.dumps(values).encode("utf-8")).decode("ascii")
+
+
+def get_values(document: Dict, sort_keys: List[Tuple[str, int]]) -> List[Any]:
+    # documents come with their raw _id, whatever its type
+    return list(map(lambda k: _get_value(document, k[0]), sort_keys))
+
+
+def decode_cursor(cursor: str, sort_keys: List[Tuple[str, int]]) -> List[Any]:
+    if sort_keys == [("_id", sort_keys[0][1])] and ObjectId.is_valid(cursor):
+        # encoded cursors are base64 of a json list and never look like an ObjectId
+        return [ObjectId(cursor)]
+    values = json_util.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    if len(values) != len(sort_keys):
+        raise ValueError(f"Cursor {cursor} does not match sort keys {sort_keys}")
+    return values
+
+
+def get_keyset_q(sort_keys: List[Tuple[str, int]], values: List[Any]) -> Dict:
+    # documents strictly after the cursor values in sort order
+    or_q = []
+    for i, (key, direction) in enumerate(sort_keys):
+        q = {}
+        for (prev_key, _), prev_value in zip(sort_keys[:i], values[:i]):
+            q[prev_key] = prev_value
+        # null and missing sort before every other value, but $gt and $lt never compare across types
+        if values[i] is None:
+            if direction == -1:
+                # nothing sorts after null in descending order
+                continue
+            q[key] = {"$ne": None}
+        elif direction == 1:
+            q[key] = {"$gt": values[i]}
+        else:
+            q["$or"] = [{key: {"$lt": values[i]}}, {key: None}]
+        or_q.append(q)
+    if len(or_q) == 1:
+        return or_q[0]
+    return {"$or": or_q}
+
+
+def _get_value(document: Dict, key: str) -> Any:
+    value = document
+    for part in key.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
@@ -0,0 +1,24 @@
+import numpy as np
+from dataclasses import dataclass
+from typing import List
+
+POPCOUNT_TABLE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+@dataclass
+class PackedBinaryString:
+    binary_string_key: str
+    length: int
+
+    def packed_key(self) -> str:
+        return f"{self.binary_string_key}_packed"
+
+    def pack(self, binary_string: str) -> bytes:
+        bits = np.frombuffer(binary_string.encode("ascii"), dtype=np.uint8) - ord("0")
+        return np.packbits(bits).tobytes()
+
+    def hamming_distances(self, packed_strings: List[bytes], from_packed_string: bytes) -> np.ndarray:
+        packed_length = len(from_packed_string)
+        matrix = np.frombuffer(b"".join(packed_strings), dtype=np.uint8).reshape(-1, packed_length)
+        xor = np.bitwise_xor(matrix, np.frombuffer(from_packed_string, dtype=np.uint8))
+        return POPCOUNT_TABLE[xor].sum(axis=1, dtype=np.int64)
@@ -0,0 +1,94 @@
+import copy
+import time
+import hashlib
+import threading
+import redis
+from bson import json_util
+from collections import OrderedDict
+from abc import ABCMeta, abstractmethod
+from typing import Any, Optional
+
+
+class QueryCache(metaclass=ABCMeta):
+    @abstractmethod
+    def get_generation(self) -> int:
+        pass
+
+    @abstractmethod
+    def get(self, key: str, generation: int) -> Optional[Any]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, generation: int, value: Any):
+        pass
+
+    @abstractmethod
+    def bump_generation(self):
+        pass
+
+
+class InMemoryQueryCache(QueryCache):
+    def __init__(self, ttl_seconds: int, max_size: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_size = max_size
+        self.generation = 0
+        self.lock = threading.Lock()
+        self._cache = OrderedDict()  # type: OrderedDict
+
+    def get_generation(self) -> int:
+        return self.generation
+
+    def get(self, key: str, generation: int) -> Optional[Any]:
+        with self.lock:
+            if generation != self.generation or key not in self._cache:
+                return None
+            expires_at, value = self._cache[key]
+            if expires_at < time.time():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+        return copy.deepcopy(value)
+
+    def set(self, key: str, generation: int, value: Any):
+        value = copy.deepcopy(value)
+        with self.lock:
+            # a value read before a write must not be cached after it
+            if generation != self.generation:
+                return
+            self._cache[key] = (time.time() + self.ttl_seconds, value)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    def bump_generation(self):
+        with self.lock:
+            self.generation += 1
+            self._cache.clear()
+
+
+class RedisQueryCache(QueryCache):
+    def __init__(self, redis_url: str, key_prefix: str, ttl_seconds: int):
+        self.db = redis.from_url(redis_url)
+        self.key_prefix = f"{key_prefix}.query_cache"
+        self.generation_key = f"{self.key_prefix}.generation"
+        self.ttl_seconds = ttl_seconds
+
+    def _get_value_key(self, key: str, generation: int) -> str:
+        return f"{self.key_prefix}.{generation}.{hashlib.sha1(key.encode('utf-8')).hexdigest()}"
+
+    def get_generation(self) -> int:
+        generation = self.db.get(self.generation_key)
+        return int(generation) if generation else 0
+
+    def get(self, key: str, generation: int) -> Optional[Any]:
+        value = self.db.get(self._get_value_key(key, generation))
+        if value is None:
+            return None
+        return json_util.loads(value)
+
+    def set(self, key: str, generation: int, value: Any):
+        # entries of an older generation are never read again and expire on their own
+        self.db.set(self._get_value_key(key, generation), json_util.dumps(value), ex=self.ttl_seconds)
+
+    def bump_generation(self):
+        self.db.incr(self.generation_key)
@@ -0,0 +1,11 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+
+@dataclass
+class QueryPage:
+    results: List[Dict]
+    has_prev: bool
+    has_next: bool
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
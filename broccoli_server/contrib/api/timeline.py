@@ -15,72 +15,37 @@ def query(
         query_params: Dict,
         projection: List[str],
         limit: int,
-        additional_q: Optional[Dict] = None
+        additional_q: Optional[Dict] = None,
+        sort: Optional[Dict[str, int]] = None
 ) -> Dict:
     if additional_q is None:
         additional_q = {}
+    if sort is None:
+        sort = {
+            "_id": -1
+        }
 
-    # get results
-    if "from" in query_params:
-        from_id = bson.ObjectId(query_params["from"])
-        q = additional_q.copy()
-        q["_id"] = {"$lt": from_id}
-
-        results = content_store.query(
-            q=q,
-            projection=projection,
-            limit=limit,
-            sort={
-                "_id": -1
-            },
-        )
-    elif "to" in query_params:
-        to_id = bson.ObjectId(query_params["to"])
-        q = additional_q.copy()
-        q["_id"] = {"$gt": to_id}
-
-        results = content_store.query(
-            q=q,
-            projection=projection,
-            limit=limit,
-            sort={
-                "_id": 1
-            },
-        )
-        results = list(reversed(results))
-    else:
-        results = content_store.query(
-            q=additional_q,
-            projection=projection,
-            limit=limit,
-            sort={
-                "_id": -1
-            }
-        )
-
-    if not results:
+    # "from" pages towards the end of the sort order and "to" pages towards its start
+    page = content_store.query_page(
+        q=additional_q,
+        sort=sort,
+        limit=limit,
+        projection=projection,
+        after=query_params.get("from"),
+        before=None if "from" in query_params else query_params.get("to")
+    )
+
+    if not page.results:
         return {
             "has_prev": False,
             "has_next": False,
-            "results": list(map(add_created_at, results))
+            "results": []
         }
 
-    # get next
-    next_from_id = bson.ObjectId(results[-1]["_id"])
-    q = additional_q.copy()
-    q["_id"] = {"$lt": next_from_id}
-    has_next = content_store.count(q) != 0
-
-    # get prev
-    prev_to_id = bson.ObjectId(results[0]["_id"])
-    q = additional_q.copy()
-    q["_id"] = {"$gt": prev_to_id}
-    has_prev = content_store.count(q) != 0
-
     return {
-        "has_prev": has_prev,
-        "prev_to": str(prev_to_id),
-        "has_next": has_next,
-        "next_from": str(next_from_id),
-        "results": list(map(add_created_at, results))
+        "has_prev": page.has_prev,
+        "prev_to": page.prev_cursor,
+        "has_next": page.has_next,
+        "next_from": page.next_cursor,
+        "results": list(map(add_created_at, page.results))
     }
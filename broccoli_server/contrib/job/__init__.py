@@ -1 +1,4 @@
 from .example import ExampleJob
+from .build_hamming_index import BuildHammingIndexJob
+from .build_packed_binary_string import BuildPackedBinaryStringJob
+from .hamming_clustering import HammingClusteringJob
@@ -0,0 +1,10 @@
+from broccoli_server.interface.job import Job, JobContext
+
+
+class BuildHammingIndexJob(Job):
+    def __init__(self, binary_string_key: str):
+        self.binary_string_key = binary_string_key
+
+    def work(self, context: JobContext):
+        indexed_count = context.content_store().build_hamming_index(self.binary_string_key)
+        context.logger().info(f"Indexed {indexed_count} documents on {self.binary_string_key}")
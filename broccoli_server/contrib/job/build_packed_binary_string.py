@@ -0,0 +1,10 @@
+from broccoli_server.interface.job import Job, JobContext
+
+
+class BuildPackedBinaryStringJob(Job):
+    def __init__(self, binary_string_key: str):
+        self.binary_string_key = binary_string_key
+
+    def work(self, context: JobContext):
+        packed_count = context.content_store().build_packed_binary_string(self.binary_string_key)
+        context.logger().info(f"Packed {packed_count} documents on {self.binary_string_key}")
@@ -0,0 +1,132 @@
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from broccoli_server.content import BulkOperation
+from broccoli_server.interface.job import Job, JobContext
+
+
+def _find_edges(buckets: List[List[Tuple[int, int]]], band_index: int, band_masks: List[int],
+                max_distance: int) -> List[Tuple[int, int]]:
+    edges = []
+    for bucket in buckets:
+        for i in range(len(bucket)):
+            doc_i, hash_i = bucket[i]
+            for j in range(i + 1, len(bucket)):
+                doc_j, hash_j = bucket[j]
+                xor = hash_i ^ hash_j
+                # only the first band two hashes share is responsible for verifying them
+                if any(xor & mask == 0 for mask in band_masks[:band_index]):
+                    continue
+                if bin(xor).count("1") <= max_distance:
+                    edges.append((doc_i, doc_j))
+    return edges
+
+
+def _find_edges_star(args) -> List[Tuple[int, int]]:
+    return _find_edges(*args)
+
+
+class HammingClusteringJob(Job):
+    def __init__(self, binary_string_key: str, cluster_key: str, max_distance: int, q: Optional[Dict] = None,
+                 processes: int = 1, buckets_per_task: int = 1000, write_batch_size: int = 1000):
+        self.binary_string_key = binary_string_key
+        self.cluster_key = cluster_key
+        self.max_distance = max_distance
+        self.q = q if q else {}
+        self.processes = processes
+        self.buckets_per_task = buckets_per_task
+        self.write_batch_size = write_batch_size
+
+    def work(self, context: JobContext):
+        content_store = context.content_store()
+        documents = content_store.iter_query(
+            self.q,
+            projection=[self.binary_string_key, self.cluster_key],
+            raw_id=True
+        )
+
+        # parse hashes, all of them need to share the length of the first valid one
+        ids, hashes, current_clusters = [], [], []
+        length = None
+        document_count = 0
+        for document in documents:
+            document_count += 1
+            binary_string = document.get(self.binary_string_key)
+            if not isinstance(binary_string, str) or not binary_string or binary_string.strip("01"):
+                continue
+            if length is None:
+                length = len(binary_string)
+            if len(binary_string) != length:
+                continue
+            ids.append(document["_id"])
+            hashes.append(int(binary_string, 2))
+            current_clusters.append(document.get(self.cluster_key))
+        context.logger().info(f"Clustering {len(ids)} of {document_count} documents")
+        if not ids:
+            return
+
+        if self.max_distance >= length:
+            # every pair of same-length hashes is within max_distance, there is nothing to verify
+            context.logger().info("Every document is within max_distance of every other")
+            edge_lists = [[(0, doc_index) for doc_index in range(1, len(ids))]]
+        else:
+            edge_lists = self._find_edge_lists(hashes, length, context)
+
+        # union find over verified pairs
+        parents = list(range(len(ids)))
+
+        def _find(x: int) -> int:
+            while parents[x] != x:
+                parents[x] = parents[parents[x]]
+                x = parents[x]
+            return x
+
+        for edges in edge_lists:
+            for a, b in edges:
+                root_a, root_b = _find(a), _find(b)
+                if root_a != root_b:
+                    parents[max(root_a, root_b)] = min(root_a, root_b)
+
+        # a cluster is identified by the id of its earliest member
+        operations = []
+        clusters = set()
+        for doc_index in range(len(ids)):
+            cluster_id = str(ids[_find(doc_index)])
+            clusters.add(cluster_id)
+            if current_clusters[doc_index] == cluster_id:
+                continue
+            operations.append(BulkOperation.update_one(
+                {"_id": ids[doc_index]},
+                {"$set": {self.cluster_key: cluster_id}}
+            ))
+        context.logger().info(f"Found {len(clusters)} clusters, updating {len(operations)} documents")
+        for i in range(0, len(operations), self.write_batch_size):
+            content_store.bulk_update(operations[i:i + self.write_batch_size])
+
+    def _find_edge_lists(self, hashes: List[int], length: int, context: JobContext) -> List[List[Tuple[int, int]]]:
+        # by pigeonhole, two hashes within max_distance agree on at least one of max_distance + 1 bands,
+        # which needs max_distance < length so that every band has a bit
+        bands = self.max_distance + 1
+        band_masks = []
+        for b in range(bands):
+            start, end = b * length // bands, (b + 1) * length // bands
+            band_masks.append(((1 << (end - start)) - 1) << (length - end))
+
+        tasks = []
+        for band_index, mask in enumerate(band_masks):
+            buckets = defaultdict(list)
+            for doc_index, h in enumerate(hashes):
+                buckets[h & mask].append((doc_index, h))
+            candidate_buckets = [bucket for bucket in buckets.values() if len(bucket) > 1]
+            for i in range(0, len(candidate_buckets), self.buckets_per_task):
+                tasks.append((
+                    candidate_buckets[i:i + self.buckets_per_task], band_index, band_masks, self.max_distance
+                ))
+        context.logger().info(f"Verifying candidates in {len(tasks)} tasks")
+
+        if self.processes > 1:
+            with ProcessPoolExecutor(max_workers=self.processes) as executor:
+                edge_lists = list(executor.map(_find_edges_star, tasks))
+        else:
+            edge_lists = list(map(_find_edges_star, tasks))
+        return edge_lists
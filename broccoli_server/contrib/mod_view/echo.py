@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List, Optional
 import json
 from broccoli_server.interface.mod_view import NonCallbackModViewColumn
 from broccoli_server.interface.mod_view.column_render import Text
@@ -18,3 +18,6 @@ class Echo(NonCallbackModViewColumn):
             return Text(
                 text="N/A"
             )
+
+    def fields(self) -> Optional[List[str]]:
+        return [self.key]
@@ -1,8 +1,12 @@
-from typing import Dict
+import logging
+from collections import Counter
+from typing import Dict, List, Optional
 from broccoli_server.interface.mod_view import ModViewColumn
 from broccoli_server.interface.mod_view.column_render import Button
 from broccoli_server.content import ContentStore
 
+logger = logging.getLogger(__name__)
+
 
 class UpdateOneButton(ModViewColumn):
     def __init__(self,
@@ -40,3 +44,49 @@ class UpdateOneButton(ModViewColumn):
             },
             allow_many=self.allow_many
         )
+
+    def callback_batch(self, documents: List[Dict], content_store: ContentStore):
+        values = []
+        for document in documents:
+            value = document[self.filter_q_key]
+            if isinstance(value, (dict, list)):
+                # $in would not match such values the way an equality filter does
+                super().callback_batch(documents, content_store)
+                return
+            if value not in values:
+                values.append(value)
+        if not values:
+            return
+        if not self.allow_many:
+            # same guard as content_store.update_one, values matching several documents are left alone
+            matches = Counter()
+            for matched in content_store.query({self.filter_q_key: {"$in": values}}, projection=[self.filter_q_key]):
+                matched_value = matched.get(self.filter_q_key)
+                # an array matches every requested value it contains, like the equality filter of callback does
+                matched_values = matched_value if isinstance(matched_value, list) else [matched_value]
+                for value in values:
+                    if value in matched_values:
+                        matches[value] += 1
+            for value in values:
+                if matches[value] == 0:
+                    logger.error(f"Document does not exist", extra={
+                        "query": {self.filter_q_key: value}
+                    })
+                elif matches[value] > 1:
+                    logger.error(f"More than one documents exist", extra={
+                        "query": {self.filter_q_key: value}
+                    })
+            values = list(filter(lambda v: matches[v] == 1, values))
+            if not values:
+                return
+        content_store.update_many(
+            filter_q={
+                self.filter_q_key: {"$in": values}
+            },
+            update_doc={
+                "$set": self.update_set_doc
+            }
+        )
+
+    def fields(self) -> Optional[List[str]]:
+        return [self.filter_q_key]
@@ -89,10 +89,11 @@ class TwitterMediaScraper(Worker, ABC):
 
         # Append the results
         context.logger().info(f"Going to append {len(new_documents)} new documents")
-        context.content_store().append_multiple(
+        append_result = context.content_store().append_multiple(
             idempotency_key=self.document_idempotency_key(),
             docs=new_documents
         )
+        context.logger().info(f"Appended {append_result.inserted} new documents, skipped {append_result.skipped()}")
 
         # Write back a new since_id
         new_since_id = max(tweets, key=lambda t: t.created_at_in_seconds).id
@@ -1,5 +1,5 @@
 from abc import ABCMeta, abstractmethod
-from typing import Dict
+from typing import Dict, List, Optional
 from broccoli_server.content import ContentStore
 from .column_render import ModViewColumnRender
 
@@ -9,6 +9,10 @@ class ModViewColumn(metaclass=ABCMeta):
     def render(self, document: Dict, content_store: ContentStore) -> ModViewColumnRender:
         pass
 
+    def render_batch(self, documents: List[Dict], content_store: ContentStore) -> List[ModViewColumnRender]:
+        # override to render a whole board at once, e.g. with one $in query instead of one query per row
+        return list(map(lambda d: self.render(d, content_store), documents))
+
     @abstractmethod
     def has_callback(self) -> bool:
         pass
@@ -21,6 +25,15 @@ class ModViewColumn(metaclass=ABCMeta):
     def callback(self, document: Dict, content_store: ContentStore):
         pass
 
+    def callback_batch(self, documents: List[Dict], content_store: ContentStore):
+        # override to handle many rows with one bulk write
+        for document in documents:
+            self.callback(document, content_store)
+
+    def fields(self) -> Optional[List[str]]:
+        # the document fields render and callback read, None means the whole document
+        return None
+
 
 class NonCallbackModViewColumn(ModViewColumn):
     @abstractmethod
@@ -14,3 +14,7 @@ class Worker(metaclass=ABCMeta):
     @abstractmethod
     def work(self, context: WorkContext):
         pass
+
+    def teardown(self):
+        # called once an instance is dropped from the worker pool, e.g. to close clients built in pre_work
+        pass
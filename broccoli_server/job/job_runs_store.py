@@ -1,13 +1,15 @@
 import pymongo
-from typing import List
+from typing import List, Optional
 from .job_run import JobRun
 
 
 class JobRunsStore(object):
-    def __init__(self, connection_string: str, db: str):
-        self.client = pymongo.MongoClient(connection_string)
+    COLLECTION_NAME = 'job_runs'
+
+    def __init__(self, connection_string: str, db: str, client: Optional[pymongo.MongoClient] = None):
+        self.client = client if client else pymongo.MongoClient(connection_string)
         self.db = self.client[db]
-        self.collection = self.db['job_runs']
+        self.collection = self.db[JobRunsStore.COLLECTION_NAME]
 
     def add_job_run(self, job_run: JobRun):
         self.collection.insert_one(job_run.to_json())
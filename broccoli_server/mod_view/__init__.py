@@ -1,3 +1,5 @@
 from .mod_view_renderer import ModViewRenderer
 from .mod_view_store import ModViewStore
 from .mod_view_query import ModViewColumn, ModViewQuery
+from .mod_view_counter import ModViewCounter
+from .mod_view_render import ModViewRender, ModViewPatch, ColumnTiming
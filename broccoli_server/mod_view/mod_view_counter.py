@@ -0,0 +1,33 @@
+import time
+import threading
+from typing import Dict, Tuple
+from broccoli_server.content import ContentStore
+
+
+class ModViewCounter(object):
+    def __init__(self, content_store: ContentStore, cap: int, ttl_seconds: int):
+        self.content_store = content_store
+        self.cap = cap
+        self.ttl_seconds = ttl_seconds
+        self.generation = 0
+        self.lock = threading.Lock()
+        self._counts = {}  # type: Dict[str, Tuple[float, int, bool, bool]]
+
+    def count(self, board_id: str, q: Dict) -> Tuple[int, bool, bool]:
+        with self.lock:
+            if board_id in self._counts:
+                expires_at, count, capped, estimated = self._counts[board_id]
+                if expires_at >= time.time():
+                    return count, capped, estimated
+            generation = self.generation
+        count, capped, estimated = self.content_store.count_capped(q, self.cap)
+        with self.lock:
+            # a count taken before a write must not be cached after it
+            if generation == self.generation:
+                self._counts[board_id] = (time.time() + self.ttl_seconds, count, capped, estimated)
+        return count, capped, estimated
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self._counts.clear()
@@ -21,6 +21,10 @@ class ModViewQuery:
     limit: Optional[int] = None
     sort: Optional[Dict] = None
 
+    def page_sort(self) -> Dict[str, int]:
+        # pages need a total order, a board without sort keeps roughly its insertion order
+        return self.sort if self.sort else {"_id": 1}
+
     def to_dict(self):
         d = {
             "q": self.query,
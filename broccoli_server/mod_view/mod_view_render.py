@@ -0,0 +1,44 @@
+from typing import Dict, List, Optional
+from dataclasses import dataclass, field
+
+
+@dataclass
+class ColumnTiming:
+    elapsed_ms: int
+    timed_out: bool = False
+
+    def to_dict(self) -> Dict:
+        return {
+            "elapsed_ms": self.elapsed_ms,
+            "timed_out": self.timed_out
+        }
+
+
+@dataclass
+class ModViewRender:
+    rows: List[Dict]
+    column_timings: Dict[str, ColumnTiming] = field(default_factory=dict)
+    has_prev: bool = False
+    has_next: bool = False
+    prev_cursor: Optional[str] = None
+    next_cursor: Optional[str] = None
+
+    def column_timings_to_dict(self) -> Dict[str, Dict]:
+        return {name: timing.to_dict() for name, timing in self.column_timings.items()}
+
+
+@dataclass
+class ModViewPatch:
+    rows: List[Dict]
+    removed_ids: List[str]
+    column_timings: Dict[str, ColumnTiming] = field(default_factory=dict)
+    # rows of documents that were inserted rather than edited, only these are new to the board
+    inserted_ids: List[str] = field(default_factory=list)
+
+    def to_dict(self) -> Dict:
+        return {
+            "rows": self.rows,
+            "removed_ids": self.removed_ids,
+            "inserted_ids": self.inserted_ids,
+            "column_timings": {name: timing.to_dict() for name, timing in self.column_timings.items()}
+        }
@@ -1,50 +1,214 @@
-from typing import Optional, Dict, List
+import time
+import bson
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from typing import Optional, Dict, List, Callable, Tuple, Any
 from broccoli_server.content import ContentStore
 from broccoli_server.interface.mod_view import ModViewColumn
 from broccoli_server.interface.mod_view import ModViewColumnRender
-from broccoli_server.mod_view.mod_view_query import ModViewQuery
+from broccoli_server.interface.mod_view.column_render import Text
+from broccoli_server.mod_view.mod_view_query import ModViewQuery, NamedModViewColumn
+from broccoli_server.mod_view.mod_view_render import ModViewRender, ModViewPatch, ColumnTiming
 
 
 class ModViewRenderer(object):
-    def __init__(self, content_store: ContentStore):
+    def __init__(self, content_store: ContentStore, threads: int = 0,
+                 column_timeout_seconds: Optional[float] = None):
         self.content_store = content_store
         self.callbacks = {}  # type: Dict[str, ModViewColumn]
+        # without threads columns render serially and cannot time out
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 0 else None
+        self.column_timeout_seconds = column_timeout_seconds
 
     def render_as_dict(self, mod_view_query: ModViewQuery) -> List[Dict[str, Optional[Dict]]]:
-        # register callbacks
+        return self.render(mod_view_query).rows
+
+    def render(self, mod_view_query: ModViewQuery, after: Optional[str] = None,
+               before: Optional[str] = None) -> ModViewRender:
+        self._register_callbacks(mod_view_query)
+
+        # do the query, only fetching the fields columns read
+        # a board with a limit is paged by its sort keys, so every page costs the same
+        page = None
+        if mod_view_query.limit:
+            page = self.content_store.query_page(
+                q=mod_view_query.query,
+                sort=mod_view_query.page_sort(),
+                limit=mod_view_query.limit,
+                projection=self._get_projection(mod_view_query),
+                after=after,
+                before=before
+            )
+            documents = page.results
+        else:
+            documents = self.content_store.query(
+                q=mod_view_query.query,
+                projection=self._get_projection(mod_view_query),
+                sort=mod_view_query.sort
+            )
+
+        rows, column_timings = self._render_rows(mod_view_query.projections, documents)
+        if not page:
+            return ModViewRender(rows=rows, column_timings=column_timings)
+        return ModViewRender(
+            rows=rows,
+            column_timings=column_timings,
+            has_prev=page.has_prev,
+            has_next=page.has_next,
+            prev_cursor=page.prev_cursor,
+            next_cursor=page.next_cursor
+        )
+
+    def render_patch(self, mod_view_query: ModViewQuery, document_ids: List[str],
+                     inserted_ids: Optional[List[str]] = None) -> ModViewPatch:
+        # re-render only the given documents, those no longer matching the board's query have left it
+        self._register_callbacks(mod_view_query)
+        documents = self.content_store.query(
+            q={"$and": [mod_view_query.query, {"_id": {"$in": ModViewRenderer._get_stored_ids(document_ids)}}]},
+            projection=self._get_projection(mod_view_query)
+        )
+        rows, column_timings = self._render_rows(mod_view_query.projections, documents)
+        found_ids = set(map(lambda d: d["_id"], documents))
+        return ModViewPatch(
+            rows=rows,
+            removed_ids=list(filter(lambda i: i not in found_ids, document_ids)),
+            column_timings=column_timings,
+            inserted_ids=list(filter(lambda i: i in found_ids, inserted_ids if inserted_ids else []))
+        )
+
+    @staticmethod
+    def _get_stored_ids(document_ids: List[str]) -> List[Any]:
+        # ids arrive stringified, a document may have been stored with either an ObjectId or a custom string _id
+        stored_ids = []  # type: List[Any]
+        for document_id in document_ids:
+            stored_ids.append(document_id)
+            if bson.ObjectId.is_valid(document_id):
+                stored_ids.append(bson.ObjectId(document_id))
+        return stored_ids
+
+    def _register_callbacks(self, mod_view_query: ModViewQuery):
         for projection in mod_view_query.projections:
             column = projection.column
             if column.has_callback():
                 self.callbacks[column.callback_id()] = column
 
-        # do the query
-        documents = self.content_store.query(
-            q=mod_view_query.query,
-            limit=mod_view_query.limit,
-            sort=mod_view_query.sort
-        )
+    def _render_rows(self, named_columns: List[NamedModViewColumn], documents: List[Dict]) \
+            -> Tuple[List[Dict], Dict[str, ColumnTiming]]:
+        # render columns
+        if self.executor:
+            column_renders = self._render_columns_concurrently(named_columns, documents)
+        else:
+            column_renders = self._render_columns_serially(named_columns, documents)
 
-        # render rows
+        # assemble rows
         rows = []
         for d in documents:
-            row_renders = {}
-            for named_columns in mod_view_query.projections:
-                column_name, column = named_columns.name, named_columns.column
-                row_renders[column_name] = self._render_to_dict(column.render(d, self.content_store))
-                if column.has_callback():
-                    row_renders[column_name]["callback_id"] = column.callback_id()
             rows.append({
-                "renders": row_renders,
+                "renders": {},
                 "raw_document": d
             })
+        column_timings = {}
+        for named_column in named_columns:
+            column_name, column = named_column.name, named_column.column
+            renders, column_timings[column_name] = column_renders[column_name]
+            if len(renders) != len(documents):
+                raise RuntimeError(f"Column {column_name} rendered {len(renders)} of {len(documents)} documents")
+            for row, render in zip(rows, renders):
+                row["renders"][column_name] = self._render_to_dict(render)
+                if column.has_callback():
+                    row["renders"][column_name]["callback_id"] = column.callback_id()
 
-        return rows
+        return rows, column_timings
+
+    def _render_columns_serially(self, named_columns: List[NamedModViewColumn], documents: List[Dict]) \
+            -> Dict[str, Tuple[List[ModViewColumnRender], ColumnTiming]]:
+        column_renders = {}
+        for named_column in named_columns:
+            started_at = time.time()
+            renders = named_column.column.render_batch(documents, self.content_store)
+            column_renders[named_column.name] = (renders, ColumnTiming(self._elapsed_ms(started_at, time.time())))
+        return column_renders
+
+    def _render_columns_concurrently(self, named_columns: List[NamedModViewColumn], documents: List[Dict]) \
+            -> Dict[str, Tuple[List[ModViewColumnRender], ColumnTiming]]:
+        started_at = time.time()
+        futures = {}  # type: Dict[str, List[Future]]
+        for named_column in named_columns:
+            column = named_column.column
+            if self._renders_by_row(column):
+                # a column rendering row by row gets its rows rendered concurrently as well
+                futures[named_column.name] = list(map(
+                    lambda d: self.executor.submit(self._timed, column.render, d, self.content_store),
+                    documents
+                ))
+            else:
+                futures[named_column.name] = [
+                    self.executor.submit(self._timed, column.render_batch, documents, self.content_store)
+                ]
+
+        # every column gets the same deadline since all of them start together
+        deadline = started_at + self.column_timeout_seconds if self.column_timeout_seconds else None
+        column_renders = {}
+        for named_column in named_columns:
+            column_futures = futures[named_column.name]
+            _, not_done = wait(column_futures, timeout=max(deadline - time.time(), 0) if deadline else None)
+            for f in not_done:
+                f.cancel()
+            results = []
+            finished_at = started_at
+            for f in column_futures:
+                if f in not_done:
+                    results.append(None)
+                    continue
+                result, f_finished_at = f.result()
+                results.append(result)
+                finished_at = max(finished_at, f_finished_at)
+            if not self._renders_by_row(named_column.column):
+                # a batch finishes for the whole board or not at all
+                results = results[0] if results[0] is not None else [None] * len(documents)
+            renders = list(map(lambda r: r if r is not None else self._timed_out_render(), results))
+            if not_done:
+                timing = ColumnTiming(self._elapsed_ms(started_at, deadline), timed_out=True)
+            else:
+                timing = ColumnTiming(self._elapsed_ms(started_at, finished_at))
+            column_renders[named_column.name] = (renders, timing)
+        return column_renders
+
+    @staticmethod
+    def _renders_by_row(column: ModViewColumn) -> bool:
+        return type(column).render_batch is ModViewColumn.render_batch
+
+    @staticmethod
+    def _timed(fn: Callable, *args) -> Tuple[Any, float]:
+        result = fn(*args)
+        return result, time.time()
+
+    @staticmethod
+    def _timed_out_render() -> ModViewColumnRender:
+        return Text(text="Timed out")
+
+    @staticmethod
+    def _elapsed_ms(started_at: float, finished_at: float) -> int:
+        return int((finished_at - started_at) * 1000)
 
     def callback(self, callback_id: str, document: Dict):
         if callback_id in self.callbacks:
             self.callbacks[callback_id].callback(document, self.content_store)
         # TODO: error here
 
+    def callback_batch(self, callback_id: str, documents: List[Dict]):
+        if callback_id in self.callbacks:
+            self.callbacks[callback_id].callback_batch(documents, self.content_store)
+
+    @staticmethod
+    def _get_projection(mod_view_query: ModViewQuery) -> Optional[List[str]]:
+        fields = set()
+        for named_column in mod_view_query.projections:
+            column_fields = named_column.column.fields()
+            if column_fields is None:
+                return None
+            fields.update(column_fields)
+        return sorted(fields)
+
     @staticmethod
     def _render_to_dict(render: ModViewColumnRender) -> Dict:
         return {
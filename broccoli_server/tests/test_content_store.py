@@ -1,7 +1,9 @@
+import bson
 import unittest
 import mongomock
 from typing import Dict, List
-from broccoli_server.content import ContentStore
+from broccoli_server.content import ContentStore, AppendResult, BulkOperation, BulkUpdateResult, InMemoryQueryCache, \
+    ContentNotifier
 
 
 class TestContentStore(unittest.TestCase):
@@ -59,10 +61,12 @@ class TestContentStoreAppendMultiple(TestContentStore):
 
     def test_idempotency_value_exists_in_persistence(self):
         self.content_store.append({"key": "value"}, "key")
-        self.content_store.append_multiple([
+        result = self.content_store.append_multiple([
             {"key": "value"},
-            {"key": "value2"}
+            {"key": "value2"},
+            {"key3": "value3"}
         ], "key")
+        assert result == AppendResult(inserted=1, skipped_missing_key=1, skipped_in_persistence=1)
         assert self.actual_documents_without_id() == [
             {
                 "key": "value",
@@ -84,11 +88,12 @@ class TestContentStoreAppendMultiple(TestContentStore):
         ]
 
     def test_idempotency_value_exists_in_batch(self):
-        self.content_store.append_multiple([
+        result = self.content_store.append_multiple([
             {"key": "value", "foo": "bar"},
             {"key": "value"},
             {"key": "value2"}
         ], "key")
+        assert result == AppendResult(inserted=2, skipped_in_batch=1)
         assert self.actual_documents_without_id() == [
             {
                 "key": "value",
@@ -101,10 +106,11 @@ class TestContentStoreAppendMultiple(TestContentStore):
 
     def test_succeed(self):
         self.content_store.append({"key": "value"}, "key")
-        self.content_store.append_multiple([
+        result = self.content_store.append_multiple([
             {"key": "value2"},
             {"key": "value3"}
         ], "key")
+        assert result == AppendResult(inserted=2)
         assert self.actual_documents_without_id() == [
             {
                 "key": "value",
@@ -117,6 +123,28 @@ class TestContentStoreAppendMultiple(TestContentStore):
             },
         ]
 
+    def test_unhashable_idempotency_values(self):
+        self.content_store.append({"key": ["a", "b"]}, "key")
+        result = self.content_store.append_multiple([
+            {"key": ["a", "b"]},
+            {"key": {"c": 1}},
+            {"key": {"c": 1}},
+            {"key": "a"},
+            {"key": "d"}
+        ], "key")
+        assert result == AppendResult(inserted=2, skipped_in_persistence=2, skipped_in_batch=1)
+        assert self.actual_documents_without_id() == [
+            {
+                "key": ["a", "b"],
+            },
+            {
+                "key": {"c": 1},
+            },
+            {
+                "key": "d",
+            },
+        ]
+
 
 class TestContentStoreQueryNearestNeighbors(TestContentStore):
     def test_invalid_from_binary_string(self):
@@ -269,3 +297,503 @@ class TestContentStoreQueryNNearestNeighbors(TestContentStore):
                 "bs": "0001",
             }
         ]
+
+
+class TestContentStoreBinaryString(TestContentStore):
+    def tearDown(self) -> None:
+        super().tearDown()
+        self.content_store.hamming_indexes.clear()
+        self.content_store.packed_binary_strings.clear()
+
+    def append_with_binary_string(self, key: str, binary_string: str, attr: bool = True):
+        self.content_store.append({"key": key, "attr": attr}, "key")
+        self.content_store.update_one_binary_string({"key": key}, "bs", binary_string)
+
+
+class TestContentStoreHammingIndex(TestContentStoreBinaryString):
+    def setUp(self) -> None:
+        self.content_store.add_hamming_index("bs", length=8, substrings=4)
+
+    def test_update_one_binary_string_writes_tokens(self):
+        self.append_with_binary_string("value_1", "00011011")
+        document = self.content_store.collection.find_one({"key": "value_1"})
+        assert document["bs_mih"] == ["0:00", "1:01", "2:10", "3:11"]
+
+    def test_update_one_binary_string_wrong_length_is_not_indexed(self):
+        self.append_with_binary_string("value_1", "00011011")
+        self.content_store.update_one_binary_string({"key": "value_1"}, "bs", "0001")
+        document = self.content_store.collection.find_one({"key": "value_1"})
+        assert document["bs"] == "0001"
+        assert "bs_mih" not in document
+
+    def test_query_nearest_hamming_neighbors(self):
+        self.append_with_binary_string("value_1", "00000000")
+        self.append_with_binary_string("value_2", "00000001")
+        self.append_with_binary_string("value_3", "00000111")
+        self.append_with_binary_string("value_4", "11111111")
+        self.append_with_binary_string("value_5", "00000000", attr=False)
+        actual_documents = self.content_store.query_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="00000000",
+            max_distance=3
+        )
+        assert list(map(lambda d: d["key"], actual_documents)) == ["value_1", "value_2", "value_3"]
+
+    def test_query_n_nearest_hamming_neighbors(self):
+        self.append_with_binary_string("value_1", "00000001")
+        self.append_with_binary_string("value_2", "00000011")
+        self.append_with_binary_string("value_3", "00000111")
+        self.append_with_binary_string("value_4", "11111111")
+        self.append_with_binary_string("value_5", "00000000", attr=False)
+        actual_documents = self.content_store.query_n_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="00000000",
+            pick_n=2
+        )
+        assert sorted(map(lambda d: d["key"], actual_documents)) == ["value_1", "value_2"]
+
+    def test_query_n_nearest_hamming_neighbors_not_enough_documents(self):
+        self.append_with_binary_string("value_1", "00000001")
+        assert self.content_store.query_n_nearest_hamming_neighbors(
+            q={},
+            binary_string_key="bs",
+            from_binary_string="00000000",
+            pick_n=2
+        ) == []
+
+    def test_appended_documents_are_indexed(self):
+        binary_strings = list(map(lambda i: format(i * 37 % 256, "08b"), range(40)))
+        self.content_store.append({"key": "value_0", "bs": binary_strings[0]}, "key")
+        self.content_store.append_multiple(list(map(
+            lambda i: {"key": f"value_{i}", "bs": binary_strings[i]}, range(1, 40)
+        )), "key")
+        for from_binary_string in ["00000000", "10101010", "11110000"]:
+            actual_documents = self.content_store.query_nearest_hamming_neighbors(
+                q={},
+                binary_string_key="bs",
+                from_binary_string=from_binary_string,
+                max_distance=2
+            )
+            expected_keys = set()
+            for i, binary_string in enumerate(binary_strings):
+                if sum(map(lambda p: p[0] != p[1], zip(binary_string, from_binary_string))) <= 2:
+                    expected_keys.add(f"value_{i}")
+            assert set(map(lambda d: d["key"], actual_documents)) == expected_keys
+
+    def test_updates_keep_tokens(self):
+        self.content_store.append({"key": "value_1", "bs": "00000001"}, "key")
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_mih"] == ["0:00", "1:00", "2:00", "3:01"]
+        self.content_store.update_many({"key": "value_1"}, {"$set": {"bs": "11000000"}})
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_mih"] == ["0:11", "1:00", "2:00", "3:00"]
+        self.content_store.bulk_update([BulkOperation.update_one({"key": "value_1"}, {"$set": {"bs": "0001"}})])
+        assert "bs_mih" not in self.content_store.collection.find_one({"key": "value_1"})
+        self.content_store.update_one({"key": "value_1"}, {"$set": {"bs": "00000011"}})
+        self.content_store.update_one({"key": "value_1"}, {"$unset": {"bs": ""}})
+        assert "bs_mih" not in self.content_store.collection.find_one({"key": "value_1"})
+
+    def test_build_hamming_index(self):
+        self.content_store.append({"key": "value_1", "bs": "00000001"}, "key")
+        self.content_store.append({"key": "value_2", "bs": "0001"}, "key")
+        self.content_store.append({"key": "value_3"}, "key")
+        assert self.content_store.build_hamming_index("bs") == 1
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_mih"] == ["0:00", "1:00", "2:00", "3:01"]
+        assert "bs_mih" not in self.content_store.collection.find_one({"key": "value_2"})
+        assert self.content_store.query_nearest_hamming_neighbors(
+            q={},
+            binary_string_key="bs",
+            from_binary_string="00000000",
+            max_distance=1
+        )[0]["key"] == "value_1"
+
+
+class TestContentStorePackedBinaryString(TestContentStoreBinaryString):
+    def setUp(self) -> None:
+        self.content_store.add_packed_binary_string("bs", length=12)
+
+    def test_update_one_binary_string_writes_packed(self):
+        self.append_with_binary_string("value_1", "000000011111")
+        document = self.content_store.collection.find_one({"key": "value_1"})
+        assert document["bs"] == "000000011111"
+        assert document["bs_packed"] == b"\x01\xf0"
+
+    def test_query_nearest_hamming_neighbors(self):
+        self.append_with_binary_string("value_1", "000000000000")
+        self.append_with_binary_string("value_2", "000000000001")
+        self.append_with_binary_string("value_3", "111111111111")
+        self.append_with_binary_string("value_4", "000000000000", attr=False)
+        self.content_store.append({"key": "value_5", "attr": True, "bs": "000000000000"}, "key")
+        actual_documents = self.content_store.query_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="000000000000",
+            max_distance=1
+        )
+        # value_5 was appended with its binary string and is packed on insert
+        assert list(map(lambda d: d["key"], actual_documents)) == ["value_1", "value_2", "value_5"]
+
+    def test_query_n_nearest_hamming_neighbors(self):
+        self.append_with_binary_string("value_1", "000000000001")
+        self.append_with_binary_string("value_2", "000000000011")
+        self.append_with_binary_string("value_3", "000000000111")
+        self.append_with_binary_string("value_4", "000000000000", attr=False)
+        actual_documents = self.content_store.query_n_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="000000000000",
+            pick_n=2
+        )
+        assert sorted(map(lambda d: d["key"], actual_documents)) == ["value_1", "value_2"]
+
+    def test_appended_and_updated_documents_are_packed(self):
+        self.content_store.append({"key": "value_1", "bs": "000000011111"}, "key")
+        self.content_store.append_multiple([{"key": "value_2", "bs": "111111110000"}], "key")
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_packed"] == b"\x01\xf0"
+        assert self.content_store.collection.find_one({"key": "value_2"})["bs_packed"] == b"\xff\x00"
+        self.content_store.update_many({"key": "value_1"}, {"$set": {"bs": "111111110000"}})
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_packed"] == b"\xff\x00"
+        self.content_store.update_one({"key": "value_2"}, {"$set": {"bs": "0001"}})
+        assert "bs_packed" not in self.content_store.collection.find_one({"key": "value_2"})
+
+    def test_build_packed_binary_string(self):
+        self.content_store.append({"key": "value_1", "bs": "111111110000"}, "key")
+        self.content_store.append({"key": "value_2", "bs": "0001"}, "key")
+        assert self.content_store.build_packed_binary_string("bs") == 1
+        assert self.content_store.collection.find_one({"key": "value_1"})["bs_packed"] == b"\xff\x00"
+        assert "bs_packed" not in self.content_store.collection.find_one({"key": "value_2"})
+
+
+class TestContentStoreAggregateHammingNeighbors(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.append({"key": "value_1", "attr": True, "bs": "0001"}, "key")
+        self.content_store.append({"key": "value_2", "attr": True, "bs": "0011"}, "key")
+        self.content_store.append({"key": "value_3", "attr": True, "bs": "0111"}, "key")
+        self.content_store.append({"key": "value_4", "attr": True, "bs": "abcd"}, "key")
+        self.content_store.append({"key": "value_5", "attr": True, "bs": "00001"}, "key")
+        self.content_store.append({"key": "value_6", "attr": False, "bs": "0000"}, "key")
+
+    def test_invalid_from_binary_string(self):
+        assert self.content_store.aggregate_nearest_hamming_neighbors(
+            q={},
+            binary_string_key="bs",
+            from_binary_string="abc",
+            max_distance=5
+        ) == []
+
+    def test_nearest(self):
+        actual_documents = self.content_store.aggregate_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="0000",
+            max_distance=2,
+            projection=["key"]
+        )
+        for i in range(len(actual_documents)):
+            del actual_documents[i]["_id"]
+        assert actual_documents == [
+            {"key": "value_1", "hamming_distance": 1},
+            {"key": "value_2", "hamming_distance": 2},
+        ]
+
+    def test_n_nearest(self):
+        actual_documents = self.content_store.aggregate_n_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="0000",
+            pick_n=2,
+            distance_key="d"
+        )
+        assert list(map(lambda d: (d["key"], d["bs"], d["d"]), actual_documents)) == [
+            ("value_1", "0001", 1),
+            ("value_2", "0011", 2),
+        ]
+
+    def test_n_nearest_not_enough_documents(self):
+        assert self.content_store.aggregate_n_nearest_hamming_neighbors(
+            q={"attr": True},
+            binary_string_key="bs",
+            from_binary_string="0000",
+            pick_n=4
+        ) == []
+
+
+class TestContentStoreRandom(TestContentStore):
+    def test_random_one_empty(self):
+        assert self.content_store.random_one({}, projection=["key"]) is None
+
+    def test_random_one(self):
+        self.content_store.append({"key": "value_1", "attr": True, "foo": "bar"}, "key")
+        self.content_store.append({"key": "value_2", "attr": False, "foo": "bar"}, "key")
+        document = self.content_store.random_one({"attr": True}, projection=["key"])
+        del document["_id"]
+        assert document == {"key": "value_1"}
+
+    def test_random_many(self):
+        self.content_store.append({"key": "value_1", "attr": True}, "key")
+        self.content_store.append({"key": "value_2", "attr": True}, "key")
+        self.content_store.append({"key": "value_3", "attr": True}, "key")
+        self.content_store.append({"key": "value_4", "attr": False}, "key")
+        documents = self.content_store.random_many({"attr": True}, 2)
+        assert len(documents) == 2
+        assert len(set(map(lambda d: d["_id"], documents))) == 2
+        assert all(map(lambda d: d["attr"], documents))
+        assert len(self.content_store.random_many({"attr": True}, 10)) == 3
+
+
+class TestContentStoreIterQuery(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": f"value_{i}", "attr": i % 2 == 0, "foo": "bar"} for i in range(7)
+        ], "key")
+
+    def test_iter_query(self):
+        documents = list(self.content_store.iter_query({"attr": True}, projection=["key"], batch_size=2))
+        assert list(map(lambda d: d["key"], documents)) == ["value_0", "value_2", "value_4", "value_6"]
+        assert all(map(lambda d: isinstance(d["_id"], str) and "foo" not in d, documents))
+
+    def test_iter_query_raw_id_and_resume(self):
+        documents = self.content_store.iter_query({}, batch_size=3, raw_id=True)
+        first_documents = [next(documents) for _ in range(4)]
+        assert isinstance(first_documents[-1]["_id"], bson.ObjectId)
+        resumed_documents = list(self.content_store.iter_query(
+            {}, batch_size=3, start_after_id=str(first_documents[-1]["_id"])
+        ))
+        assert list(map(lambda d: d["key"], resumed_documents)) == ["value_4", "value_5", "value_6"]
+
+
+class TestContentStoreUpdate(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": "value_1", "attr": True},
+            {"key": "value_2", "attr": True},
+            {"key": "value_3", "attr": False},
+        ], "key")
+
+    def test_update_one(self):
+        self.content_store.update_one({"key": "value_1"}, {"$set": {"foo": "bar"}})
+        assert self.content_store.count({"foo": "bar"}) == 1
+
+    def test_update_one_more_than_one(self):
+        self.content_store.update_one({"attr": True}, {"$set": {"foo": "bar"}})
+        assert self.content_store.count({"foo": "bar"}) == 0
+
+    def test_update_one_allow_many(self):
+        self.content_store.update_one({"attr": True}, {"$set": {"foo": "bar"}}, allow_many=True)
+        assert self.content_store.count({"foo": "bar"}) == 2
+
+    def test_bulk_update(self):
+        result = self.content_store.bulk_update([
+            BulkOperation.update_one({"key": "value_1"}, {"$set": {"foo": "bar"}}),
+            BulkOperation.update_many({"attr": True}, {"$set": {"moderated": True}}),
+            BulkOperation.delete_one({"key": "value_3"}),
+            BulkOperation("unknown", {}),
+        ])
+        assert result == BulkUpdateResult(matched=3, modified=3, deleted=1)
+        assert self.actual_documents_without_id() == [
+            {"key": "value_1", "attr": True, "foo": "bar", "moderated": True},
+            {"key": "value_2", "attr": True, "moderated": True},
+        ]
+
+    def test_bulk_update_empty(self):
+        assert self.content_store.bulk_update([]) == BulkUpdateResult()
+
+
+class TestContentStoreCountCapped(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": "value_1", "attr": True},
+            {"key": "value_2", "attr": True},
+            {"key": "value_3", "attr": False},
+        ], "key")
+
+    def test_under_cap(self):
+        assert self.content_store.count_capped({"attr": True}, 2) == (2, False, False)
+
+    def test_over_cap(self):
+        assert self.content_store.count_capped({"attr": {"$exists": True}}, 2) == (2, True, False)
+
+    def test_empty_query(self):
+        # an estimate is not capped, it may be above or below the real count
+        assert self.content_store.count_capped({}, 2) == (3, False, True)
+
+
+class TestContentStoreWriteListener(TestContentStore):
+    def setUp(self) -> None:
+        self.notifier = ContentNotifier(max_document_ids=3)
+        self.content_store.add_write_listener(self.notifier.publish)
+        self.subscription = self.notifier.subscribe()
+
+    def tearDown(self) -> None:
+        self.content_store.write_listeners = []
+        super().tearDown()
+
+    def test_ids(self):
+        self.content_store.append_multiple([{"key": "value_1"}, {"key": "value_2"}], "key")
+        self.content_store.update_one({"key": "value_1"}, {"$set": {"foo": "bar"}})
+        ids = list(map(lambda d: d["_id"], self.content_store.query({}, sort={"key": 1})))
+        changes = self.subscription.wait(timeout_seconds=0)
+        assert changes.document_ids == sorted(ids) and not changes.unknown
+        assert self.subscription.wait(timeout_seconds=0) is None
+
+    def test_inserted_ids(self):
+        self.content_store.append({"key": "value_1"}, "key")
+        self.subscription.wait(timeout_seconds=0)
+        self.content_store.update_one({"key": "value_1"}, {"$set": {"foo": "bar"}})
+        self.content_store.append({"key": "value_2"}, "key")
+        changes = self.subscription.wait(timeout_seconds=0)
+        inserted_id = self.content_store.query({"key": "value_2"})[0]["_id"]
+        assert len(changes.document_ids) == 2
+        assert changes.inserted_ids == [inserted_id]
+
+    def test_unknown(self):
+        self.content_store.append({"key": "value_1"}, "key")
+        self.content_store.update_many({}, {"$set": {"foo": "bar"}})
+        changes = self.subscription.wait(timeout_seconds=0)
+        assert len(changes.document_ids) == 1 and changes.unknown
+
+    def test_too_many_ids(self):
+        self.content_store.append_multiple(list(map(lambda i: {"key": f"value_{i}"}, range(5))), "key")
+        changes = self.subscription.wait(timeout_seconds=0)
+        assert changes.document_ids == [] and changes.unknown
+
+    def test_unsubscribe(self):
+        self.notifier.unsubscribe(self.subscription)
+        self.content_store.append({"key": "value_1"}, "key")
+        assert self.subscription.wait(timeout_seconds=0) is None
+
+
+class TestContentStoreQueryCache(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.query_cache = InMemoryQueryCache(ttl_seconds=60, max_size=2)
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        self.content_store.query_cache = None
+
+    def test_query_is_cached(self):
+        self.content_store.append({"key": "value_1"}, "key")
+        assert len(self.content_store.query({})) == 1
+        self.content_store.collection.insert_one({"key": "value_2"})
+        assert len(self.content_store.query({})) == 1
+        assert self.content_store.count({}) == 2
+        assert self.content_store.count({}) == 2
+
+    def test_write_invalidates(self):
+        self.content_store.append({"key": "value_1", "attr": False}, "key")
+        assert self.content_store.count({"attr": True}) == 0
+        self.content_store.update_one({"key": "value_1"}, {"$set": {"attr": True}})
+        assert self.content_store.count({"attr": True}) == 1
+        self.content_store.append({"key": "value_2", "attr": True}, "key")
+        assert len(self.content_store.query({"attr": True})) == 2
+
+    def test_sort_is_part_of_key(self):
+        self.content_store.append_multiple([{"key": "value_1", "n": 1}, {"key": "value_2", "n": 2}], "key")
+        assert self.content_store.query({}, sort={"n": 1})[0]["key"] == "value_1"
+        assert self.content_store.query({}, sort={"n": -1})[0]["key"] == "value_2"
+
+    def test_results_are_copies(self):
+        self.content_store.append({"key": "value_1"}, "key")
+        self.content_store.query({})[0]["key"] = "changed"
+        assert self.content_store.query({})[0]["key"] == "value_1"
+
+    def test_reused_arguments_hit(self):
+        self.content_store.append({"key": "value_1", "n": 1}, "key")
+        projection, q = ["key"], {}
+        datetime_q = [{"key": "created_at", "op": "lt", "value": 0}]
+        assert len(self.content_store.query(q, projection=projection)) == 1
+        assert self.content_store.count(q, datetime_q=datetime_q) == 0
+        self.content_store.collection.insert_one({"key": "value_2", "n": 1})
+        assert len(self.content_store.query(q, projection=projection)) == 1
+        assert self.content_store.count(q, datetime_q=datetime_q) == 0
+        assert projection == ["key"] and q == {}
+
+    def test_lru_eviction(self):
+        self.content_store.append({"key": "value_1", "n": 1}, "key")
+        self.content_store.count({"n": 1})
+        self.content_store.count({"n": 2})
+        self.content_store.count({"n": 3})
+        self.content_store.collection.insert_one({"key": "value_2", "n": 1})
+        assert self.content_store.count({"n": 1}) == 2
+
+
+class TestContentStoreQueryPage(TestContentStore):
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": f"value_{i}", "attr": i != 3, "rank": i % 3} for i in range(7)
+        ], "key")
+
+    @staticmethod
+    def keys(page) -> List[str]:
+        return list(map(lambda d: d["key"], page.results))
+
+    def test_pages_by_id(self):
+        page = self.content_store.query_page({"attr": True}, sort={"_id": -1}, limit=2, projection=["key"])
+        assert self.keys(page) == ["value_6", "value_5"]
+        assert not page.has_prev and page.has_next
+        assert page.next_cursor == page.results[-1]["_id"]
+
+        page = self.content_store.query_page({"attr": True}, sort={"_id": -1}, limit=2, after=page.next_cursor)
+        assert self.keys(page) == ["value_4", "value_2"]
+        assert page.has_prev and page.has_next
+
+        page = self.content_store.query_page({"attr": True}, sort={"_id": -1}, limit=2, after=page.next_cursor)
+        assert self.keys(page) == ["value_1", "value_0"]
+        assert page.has_prev and not page.has_next
+
+        page = self.content_store.query_page({"attr": True}, sort={"_id": -1}, limit=2, before=page.prev_cursor)
+        assert self.keys(page) == ["value_4", "value_2"]
+        assert page.has_prev and page.has_next
+
+    def test_pages_by_compound_sort(self):
+        sort = {"rank": 1, "key": -1}
+        seen = []
+        page = self.content_store.query_page({}, sort=sort, limit=3, projection=["key"])
+        seen += self.keys(page)
+        while page.has_next:
+            page = self.content_store.query_page({}, sort=sort, limit=3, projection=["key"], after=page.next_cursor)
+            seen += self.keys(page)
+        assert seen == ["value_6", "value_3", "value_0", "value_4", "value_1", "value_5", "value_2"]
+
+        page = self.content_store.query_page({}, sort=sort, limit=3, before=page.prev_cursor)
+        assert self.keys(page) == ["value_4", "value_1", "value_5"]
+        assert page.has_prev and page.has_next
+
+    def test_pages_past_missing_sort_field(self):
+        self.content_store.update_many({"rank": 0}, {"$unset": {"rank": ""}})
+        for sort, expected in [
+            ({"rank": 1, "key": 1}, ["value_0", "value_3", "value_6", "value_1", "value_4", "value_2", "value_5"]),
+            ({"rank": -1, "key": 1}, ["value_2", "value_5", "value_1", "value_4", "value_0", "value_3", "value_6"]),
+        ]:
+            page = self.content_store.query_page({}, sort=sort, limit=2)
+            seen = self.keys(page)
+            while page.has_next:
+                page = self.content_store.query_page({}, sort=sort, limit=2, after=page.next_cursor)
+                seen += self.keys(page)
+            assert seen == expected
+            seen = self.keys(page)
+            while page.has_prev:
+                page = self.content_store.query_page({}, sort=sort, limit=2, before=page.prev_cursor)
+                seen = self.keys(page) + seen
+            assert seen == expected
+
+    def test_pages_by_string_id(self):
+        self.content_store.collection.insert_many([
+            {"_id": f"custom_{i}", "key": f"custom_{i}", "rank": i % 2} for i in range(3)
+        ])
+        q = {"key": {"$regex": "^custom_"}}
+        for sort, expected in [
+            ({"_id": 1}, ["custom_0", "custom_1", "custom_2"]),
+            ({"rank": 1, "_id": -1}, ["custom_2", "custom_0", "custom_1"]),
+        ]:
+            page = self.content_store.query_page(q, sort=sort, limit=2)
+            assert list(map(lambda d: d["_id"], page.results)) == expected[:2]
+            page = self.content_store.query_page(q, sort=sort, limit=2, after=page.next_cursor)
+            assert self.keys(page) == expected[2:]
+            assert page.has_prev and not page.has_next
+            page = self.content_store.query_page(q, sort=sort, limit=2, before=page.prev_cursor)
+            assert self.keys(page) == expected[:2]
+
+    def test_empty(self):
+        page = self.content_store.query_page({"attr": "nope"}, sort={"_id": -1}, limit=2)
+        assert page.results == [] and not page.has_prev and not page.has_next
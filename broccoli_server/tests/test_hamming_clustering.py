@@ -0,0 +1,82 @@
+import unittest
+import mongomock
+from typing import Dict
+from broccoli_server.content import ContentStore
+from broccoli_server.contrib.job import HammingClusteringJob
+from broccoli_server.contrib.job.hamming_clustering import _find_edges
+from broccoli_server.job.job_context import JobContextImpl
+
+
+class TestHammingClustering(unittest.TestCase):
+    @classmethod
+    @mongomock.patch("mongodb://localhost:27017/test_db")
+    def setUpClass(cls) -> None:
+        cls.content_store = ContentStore("localhost:27017", "test_db")
+
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": "a", "hash": "00000000"},
+            {"key": "b", "hash": "00000001"},
+            {"key": "c", "hash": "00000011"},
+            {"key": "d", "hash": "11110000"},
+            {"key": "e", "hash": "11111111"},
+            {"key": "not_binary", "hash": "0120"},
+            {"key": "other_length", "hash": "0000000"},
+        ], "key")
+        self.ids = {}  # type: Dict[str, str]
+        for document in self.content_store.query({}):
+            self.ids[document["key"]] = document["_id"]
+
+    def tearDown(self) -> None:
+        self.content_store.client.drop_database("test_db")
+
+    def run_job(self, **kwargs) -> JobContextImpl:
+        context = JobContextImpl("test", self.content_store)
+        HammingClusteringJob("hash", "cluster", **kwargs).work(context)
+        return context
+
+    def clusters(self) -> Dict[str, str]:
+        clusters = {}
+        for document in self.content_store.query({}):
+            clusters[document["key"]] = document.get("cluster")
+        return clusters
+
+    def test_clusters(self):
+        self.run_job(max_distance=1)
+        # a and c are two bits apart but linked through b
+        assert self.clusters() == {
+            "a": self.ids["a"],
+            "b": self.ids["a"],
+            "c": self.ids["a"],
+            "d": self.ids["d"],
+            "e": self.ids["e"],
+            "not_binary": None,
+            "other_length": None,
+        }
+
+    def test_processes(self):
+        self.run_job(max_distance=4, processes=2, buckets_per_task=1)
+        clusters = self.clusters()
+        # d is four bits from a and e four bits from d
+        assert set(map(lambda k: clusters[k], ["a", "b", "c", "d", "e"])) == {self.ids["a"]}
+
+    def test_max_distance_covers_every_bit(self):
+        # a and e differ in every bit, so they share no band
+        self.content_store.delete_many({"key": {"$nin": ["a", "e"]}})
+        self.run_job(max_distance=8)
+        assert self.clusters() == {"a": self.ids["a"], "e": self.ids["a"]}
+
+    def test_rerun_writes_nothing(self):
+        self.run_job(max_distance=1)
+        context = self.run_job(max_distance=1)
+        assert "Found 3 clusters, updating 0 documents" in context.drain_log_lines()
+
+    def test_first_shared_band_verifies(self):
+        band_masks = [0b11110000, 0b00001111]
+        assert _find_edges([[(0, 0b00000000), (1, 0b00000001)]], 0, band_masks, 1) == [(0, 1)]
+        assert _find_edges([[(0, 0b00000000), (1, 0b00010000)]], 1, band_masks, 1) == [(0, 1)]
+        # identical hashes share both bands, only the first one reports them
+        assert _find_edges([[(0, 0b00000000), (1, 0b00000000)]], 0, band_masks, 1) == [(0, 1)]
+        assert _find_edges([[(0, 0b00000000), (1, 0b00000000)]], 1, band_masks, 1) == []
+        # sharing a band is not enough
+        assert _find_edges([[(0, 0b00000000), (1, 0b00000011)]], 0, band_masks, 1) == []
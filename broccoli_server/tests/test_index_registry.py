@@ -0,0 +1,31 @@
+import unittest
+from broccoli_server.utils import IndexRegistry
+
+
+class TestIndexRegistry(unittest.TestCase):
+    def setUp(self) -> None:
+        self.index_registry = IndexRegistry()
+        self.index_registry.add("repo", [("attr", 1), ("created", -1)])
+        self.index_registry.add("repo", [("sort_key", -1)])
+        self.index_registry.add("other", [("other_attr", 1)])
+
+    def test_add_merges_same_keys(self):
+        self.index_registry.add("repo", [("attr", 1), ("created", -1)], unique=True)
+        assert len(self.index_registry.get_all()) == 3
+        assert self.index_registry.get_all()[0].unique
+
+    def test_empty_query_is_indexed(self):
+        assert self.index_registry.is_query_indexed("repo", {})
+
+    def test_query_field_is_indexed(self):
+        assert self.index_registry.is_query_indexed("repo", {"attr": True, "foo": "bar"})
+        assert self.index_registry.is_query_indexed("repo", {"$and": [{"foo": "bar"}, {"attr": True}]})
+
+    def test_sort_field_is_indexed(self):
+        assert self.index_registry.is_query_indexed("repo", {}, sort={"sort_key": -1})
+        assert self.index_registry.is_query_indexed("repo", {"foo": "bar"}, sort={"_id": -1})
+
+    def test_query_field_is_not_indexed(self):
+        assert not self.index_registry.is_query_indexed("repo", {"created": 1})
+        assert not self.index_registry.is_query_indexed("repo", {"other_attr": 1})
+        assert not self.index_registry.is_query_indexed("repo", {}, sort={"created": -1})
@@ -0,0 +1,167 @@
+import unittest
+import mongomock
+from unittest import mock
+from broccoli_server.content import ContentStore
+from broccoli_server.interface.worker import Worker, WorkContext
+from broccoli_server.worker import MetadataStoreFactory, WorkContextFactory, WorkerCache, WorkerConfigStore, \
+    WorkerPool, WorkFactory, WorkerMetadata
+from broccoli_server.worker.metadata_store import MetadataStoreImpl
+
+
+class SetsState(Worker):
+    def __init__(self, fail: bool = False):
+        self.fail = fail
+
+    def get_id(self) -> str:
+        return "sets_state"
+
+    def pre_work(self, context: WorkContext):
+        pass
+
+    def work(self, context: WorkContext):
+        metadata_store = context.metadata_store()
+        count = metadata_store.get("count") if metadata_store.exists("count") else 0
+        metadata_store.set("count", count + 1)
+        if self.fail:
+            raise RuntimeError("boom")
+
+
+class TestMetadataStore(unittest.TestCase):
+    @classmethod
+    @mongomock.patch("mongodb://localhost:27017/test_db")
+    def setUpClass(cls) -> None:
+        cls.worker_cache = WorkerCache()
+        cls.worker_cache.register_module("sets_state", SetsState)
+        cls.worker_config_store = WorkerConfigStore("localhost:27017", "test_db", cls.worker_cache)
+        cls.client = cls.worker_config_store.client
+
+    def setUp(self) -> None:
+        self.worker_config_store.add(WorkerMetadata("sets_state", {}, 60, -1))
+        self.collection = self.client["test_db"]["workers"]
+        self.collection.update_one({"worker_id": "sets_state"}, {"$set": {"state": {"kept": 1}}})
+
+    def tearDown(self) -> None:
+        self.client.drop_database("test_db")
+
+    def build(self, optimistic: bool = False):
+        return MetadataStoreFactory("localhost:27017", "test_db", client=self.client, optimistic=optimistic) \
+            .build("sets_state")
+
+    def get_document(self):
+        return self.collection.find_one({"worker_id": "sets_state"})
+
+    def test_buffers_until_flush(self):
+        metadata_store = self.build()
+        metadata_store.set("a", 1)
+        metadata_store.set("a", 2)
+        assert metadata_store.get("a") == 2
+        assert "a" not in self.get_document()["state"]
+        assert metadata_store.flush()
+        document = self.get_document()
+        # keys are set one by one, the rest of the state is left alone
+        assert document["state"] == {"kept": 1, "a": 2}
+        assert document["state_version"] == 1
+
+    def test_flush_without_writes(self):
+        metadata_store = self.build()
+        assert metadata_store.get("kept") == 1
+        assert metadata_store.flush()
+        assert "state_version" not in self.get_document()
+
+    def test_loads_state_once(self):
+        metadata_store = self.build()
+        assert metadata_store.get("kept") == 1
+        self.collection.update_one({"worker_id": "sets_state"}, {"$set": {"state.kept": 2}})
+        assert metadata_store.get("kept") == 1
+
+    def test_preload(self):
+        metadata_store = self.build()
+        metadata_store.preload({"preloaded": True}, 0)
+        assert metadata_store.exists("preloaded") and not metadata_store.exists("kept")
+
+    def test_optimistic(self):
+        metadata_store = self.build(optimistic=True)
+        metadata_store.set("a", 1)
+        assert metadata_store.flush()
+        metadata_store.set("a", 2)
+        assert metadata_store.flush()
+        assert self.get_document()["state_version"] == 2
+
+    def test_optimistic_conflict(self):
+        metadata_store = self.build(optimistic=True)
+        other = self.build(optimistic=True)
+        metadata_store.set("a", 1)
+        other.set("a", 2)
+        assert other.flush()
+        with self.assertLogs("broccoli_server.worker.metadata_store", level="ERROR"):
+            assert not metadata_store.flush()
+        assert self.get_document()["state"]["a"] == 2
+
+    def test_not_optimistic_last_write_wins(self):
+        metadata_store = self.build()
+        other = self.build()
+        metadata_store.set("a", 1)
+        other.set("a", 2)
+        assert other.flush()
+        assert metadata_store.flush()
+        assert self.get_document()["state"]["a"] == 1
+
+
+class TestWorkFactoryMetadata(TestMetadataStore):
+    def run_work(self, optimistic: bool = False, fail: bool = False, before_work=None, worker_pool=None):
+        metadata_store_factory = MetadataStoreFactory("localhost:27017", "test_db", client=self.client,
+                                                      optimistic=optimistic)
+        work_context_factory = WorkContextFactory(ContentStore("localhost:27017", "test_db", client=self.client),
+                                                  metadata_store_factory)
+        work_factory = WorkFactory(
+            work_context_factory=work_context_factory,
+            worker_cache=self.worker_cache,
+            worker_config_store=self.worker_config_store,
+            sentry_enabled=False,
+            worker_pool=worker_pool if worker_pool else WorkerPool(self.worker_cache, max_size=10, idle_seconds=3600)
+        )
+        work_func, _ = work_factory.get_work_func("sets_state", {"fail": fail})
+        if before_work:
+            before_work()
+        work_func()
+
+    def test_run(self):
+        self.run_work()
+        self.run_work()
+        document = self.get_document()
+        assert document["state"] == {"kept": 1, "count": 2}
+        assert document["last_status"] == "succeeded"
+
+    def test_flush_on_failure(self):
+        self.run_work(fail=True)
+        document = self.get_document()
+        assert document["state"]["count"] == 1
+        assert document["last_status"] == "failed"
+
+    def test_conflict_fails_run(self):
+        def _conflict():
+            self.collection.update_one({"worker_id": "sets_state"}, {"$inc": {"state_version": 1}})
+
+        with self.assertLogs("broccoli_server.worker.work_factory", level="ERROR"):
+            self.run_work(optimistic=True, before_work=_conflict)
+        document = self.get_document()
+        assert "count" not in document["state"]
+        assert document["last_status"] == "failed"
+
+    def test_flush_error_on_failure(self):
+        worker_pool = WorkerPool(self.worker_cache, max_size=10, idle_seconds=3600)
+
+        def _raise(store):
+            raise RuntimeError("database is gone")
+
+        with mock.patch.object(MetadataStoreImpl, "flush", _raise):
+            with self.assertLogs("broccoli_server.worker.work_factory", level="ERROR") as logs:
+                self.run_work(fail=True, worker_pool=worker_pool)
+        # the work exception is reported before the flush one
+        assert list(map(lambda r: r.getMessage(), logs.records)) == [
+            "Fails to execute work", "Fails to flush worker metadata of a failed run"
+        ]
+        assert self.get_document()["last_status"] == "failed"
+        # the failed instance was released and discarded
+        status, pooled_worker = worker_pool.acquire("sets_state", {"fail": True})
+        assert status and not pooled_worker.pre_worked
@@ -0,0 +1,217 @@
+import time
+import unittest
+import mongomock
+from typing import Dict, List
+from broccoli_server.content import ContentStore
+from broccoli_server.contrib.mod_view.echo import Echo
+from broccoli_server.contrib.mod_view.update_one_button import UpdateOneButton
+from broccoli_server.interface.mod_view import NonCallbackModViewColumn
+from broccoli_server.interface.mod_view.column_render import Text
+from broccoli_server.mod_view import ModViewRenderer, ModViewQuery
+from broccoli_server.mod_view.mod_view_query import NamedModViewColumn
+
+
+class WholeDocument(NonCallbackModViewColumn):
+    def render(self, document: Dict, content_store: ContentStore) -> Text:
+        return Text(text=str(len(document)))
+
+
+class BatchedKeys(NonCallbackModViewColumn):
+    def __init__(self):
+        self.batches = []  # type: List[int]
+
+    def render(self, document: Dict, content_store: ContentStore) -> Text:
+        raise RuntimeError("should render in batch")
+
+    def render_batch(self, documents: List[Dict], content_store: ContentStore) -> List[Text]:
+        self.batches.append(len(documents))
+        keys = list(map(lambda d: d["key"], documents))
+        found = content_store.query({"key": {"$in": keys}}, projection=["key"])
+        found_keys = set(map(lambda d: d["key"], found))
+        return list(map(lambda k: Text(text=str(k in found_keys)), keys))
+
+
+class Slow(NonCallbackModViewColumn):
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+
+    def render(self, document: Dict, content_store: ContentStore) -> Text:
+        time.sleep(self.seconds)
+        return Text(text="done")
+
+
+class TestModViewRenderer(unittest.TestCase):
+    @classmethod
+    @mongomock.patch("mongodb://localhost:27017/test_db")
+    def setUpClass(cls) -> None:
+        cls.content_store = ContentStore("localhost:27017", "test_db")
+        cls.renderer = ModViewRenderer(cls.content_store)
+
+    def setUp(self) -> None:
+        self.content_store.append_multiple([
+            {"key": "value_1", "attr": True, "blob": "x" * 100},
+            {"key": "value_2", "attr": False, "blob": "y" * 100},
+        ], "key")
+
+    def tearDown(self) -> None:
+        self.content_store.client.drop_database("test_db")
+
+    def test_projection(self):
+        rows = self.renderer.render_as_dict(ModViewQuery(
+            query={},
+            projections=[
+                NamedModViewColumn("attr", Echo("attr")),
+                NamedModViewColumn("button", UpdateOneButton("Go", "go", "key", {"attr": True})),
+            ],
+            sort={"key": 1}
+        ))
+        assert list(map(lambda r: r["renders"]["attr"]["data"]["text"], rows)) == ["true", "false"]
+        assert list(map(lambda r: sorted(r["raw_document"].keys()), rows)) == [["_id", "attr", "key"]] * 2
+
+    def test_no_projection_when_a_column_reads_everything(self):
+        rows = self.renderer.render_as_dict(ModViewQuery(
+            query={"key": "value_1"},
+            projections=[
+                NamedModViewColumn("attr", Echo("attr")),
+                NamedModViewColumn("size", WholeDocument()),
+            ]
+        ))
+        assert rows[0]["renders"]["size"]["data"]["text"] == "4"
+        assert "blob" in rows[0]["raw_document"]
+
+    def test_render_batch(self):
+        column = BatchedKeys()
+        rows = self.renderer.render_as_dict(ModViewQuery(
+            query={},
+            projections=[
+                NamedModViewColumn("key", Echo("key")),
+                NamedModViewColumn("found", column),
+            ],
+            sort={"key": 1}
+        ))
+        assert column.batches == [2]
+        assert list(map(lambda r: r["renders"]["key"]["data"]["text"], rows)) == ['"value_1"', '"value_2"']
+        assert list(map(lambda r: r["renders"]["found"]["data"]["text"], rows)) == ["True", "True"]
+
+    def test_pages(self):
+        self.content_store.append_multiple([
+            {"key": "value_3", "attr": True},
+            {"key": "value_4", "attr": False},
+            {"key": "value_5", "attr": True},
+        ], "key")
+        mod_view_query = ModViewQuery(
+            query={},
+            projections=[NamedModViewColumn("key", Echo("key"))],
+            limit=2,
+            sort={"attr": -1, "key": 1}
+        )
+
+        def keys(render):
+            return list(map(lambda r: r["raw_document"]["key"], render.rows))
+
+        board_render = self.renderer.render(mod_view_query)
+        assert keys(board_render) == ["value_1", "value_3"]
+        assert not board_render.has_prev and board_render.has_next
+        board_render = self.renderer.render(mod_view_query, after=board_render.next_cursor)
+        assert keys(board_render) == ["value_5", "value_2"]
+        assert board_render.has_prev and board_render.has_next
+        board_render = self.renderer.render(mod_view_query, after=board_render.next_cursor)
+        assert keys(board_render) == ["value_4"]
+        assert board_render.has_prev and not board_render.has_next
+        board_render = self.renderer.render(mod_view_query, before=board_render.prev_cursor)
+        assert keys(board_render) == ["value_5", "value_2"]
+
+    def test_patch(self):
+        mod_view_query = ModViewQuery(
+            query={"attr": False},
+            projections=[
+                NamedModViewColumn("key", Echo("key")),
+                NamedModViewColumn("button", UpdateOneButton("Go", "go", "key", {"attr": True})),
+            ]
+        )
+        rows = self.renderer.render_as_dict(mod_view_query)
+        assert len(rows) == 1
+        document_id = rows[0]["raw_document"]["_id"]
+        self.content_store.update_one({"key": "value_2"}, {"$set": {"extra": 1}})
+        patch = self.renderer.render_patch(mod_view_query, [document_id])
+        assert patch.removed_ids == []
+        assert patch.inserted_ids == []
+        assert list(map(lambda r: r["raw_document"]["_id"], patch.rows)) == [document_id]
+        patch = self.renderer.render_patch(mod_view_query, [document_id], inserted_ids=[document_id])
+        assert patch.inserted_ids == [document_id]
+
+        self.renderer.callback("go", rows[0]["raw_document"])
+        patch = self.renderer.render_patch(mod_view_query, [document_id])
+        assert patch.rows == []
+        assert patch.removed_ids == [document_id]
+
+    def test_patch_string_id(self):
+        self.content_store.collection.insert_one({"_id": "custom", "key": "custom", "attr": False})
+        mod_view_query = ModViewQuery(
+            query={"attr": False},
+            projections=[NamedModViewColumn("button", UpdateOneButton("Go", "go", "key", {"attr": True}))]
+        )
+        patch = self.renderer.render_patch(mod_view_query, ["custom"])
+        assert list(map(lambda r: r["raw_document"]["_id"], patch.rows)) == ["custom"]
+        self.renderer.callback("go", patch.rows[0]["raw_document"])
+        patch = self.renderer.render_patch(mod_view_query, ["custom"])
+        assert patch.rows == [] and patch.removed_ids == ["custom"]
+
+    def test_callback_batch(self):
+        self.content_store.collection.insert_many([
+            {"key": "value_3", "attr": False},
+            {"key": "value_3", "attr": False},
+        ])
+        mod_view_query = ModViewQuery(
+            query={"attr": False},
+            projections=[NamedModViewColumn("button", UpdateOneButton("Go", "go", "key", {"attr": True}))]
+        )
+        rows = self.renderer.render_as_dict(mod_view_query)
+        assert len(rows) == 3
+        self.renderer.callback_batch("go", list(map(lambda r: r["raw_document"], rows)))
+        # value_3 is ambiguous and left alone
+        assert self.content_store.count({"attr": True}) == 2
+        assert self.content_store.count({"key": "value_3", "attr": False}) == 2
+
+    def test_callback_batch_array_fields(self):
+        self.content_store.collection.insert_many([
+            {"tag": ["a", "b"], "attr": False},
+            {"tag": "b", "attr": False},
+            {"tag": "c", "attr": False},
+        ])
+        column = UpdateOneButton("Go", "go", "tag", {"attr": True})
+        column.callback_batch([{"tag": "a"}, {"tag": "b"}, {"tag": "c"}], self.content_store)
+        # a matches the array only, b matches the array and the string and is left alone
+        updated = self.content_store.query({"attr": True, "tag": {"$exists": True}}, sort={"_id": 1})
+        assert list(map(lambda d: d["tag"], updated)) == [["a", "b"], "c"]
+
+
+class TestModViewRendererThreads(TestModViewRenderer):
+    @classmethod
+    @mongomock.patch("mongodb://localhost:27017/test_db")
+    def setUpClass(cls) -> None:
+        cls.content_store = ContentStore("localhost:27017", "test_db")
+        cls.renderer = ModViewRenderer(cls.content_store, threads=4, column_timeout_seconds=0.5)
+
+    def test_timeout(self):
+        board_render = self.renderer.render(ModViewQuery(
+            query={},
+            projections=[
+                NamedModViewColumn("key", Echo("key")),
+                NamedModViewColumn("slow", Slow(2)),
+            ],
+            sort={"key": 1}
+        ))
+        assert list(map(lambda r: r["renders"]["key"]["data"]["text"], board_render.rows)) == ['"value_1"', '"value_2"']
+        assert list(map(lambda r: r["renders"]["slow"]["data"]["text"], board_render.rows)) == ["Timed out"] * 2
+        assert not board_render.column_timings["key"].timed_out
+        assert board_render.column_timings["slow"].timed_out
+
+    def test_rows_render_concurrently(self):
+        board_render = self.renderer.render(ModViewQuery(
+            query={},
+            projections=[NamedModViewColumn("slow", Slow(0.3))]
+        ))
+        assert list(map(lambda r: r["renders"]["slow"]["data"]["text"], board_render.rows)) == ["done"] * 2
+        assert not board_render.column_timings["slow"].timed_out
+        assert board_render.column_timings["slow"].elapsed_ms < 500
@@ -0,0 +1,36 @@
+import unittest
+import mongomock
+from types import SimpleNamespace
+from broccoli_server.utils import MongoClientRegistry, MongoClientStats
+
+
+class TestMongoClientRegistry(unittest.TestCase):
+    @mongomock.patch(("mongodb://localhost:27017/test_db", "mongodb://localhost:27018/test_db"))
+    def test_one_client_per_connection_string(self):
+        registry = MongoClientRegistry(max_pool_size=10)
+        content_client = registry.get("mongodb://localhost:27017/test_db", "content")
+        assert registry.get("mongodb://localhost:27017/test_db", "workers") is content_client
+        assert registry.get("mongodb://localhost:27018/test_db", "migration") is not content_client
+        assert list(map(lambda s: s["roles"], registry.get_stats())) == [["content", "workers"], ["migration"]]
+
+
+class TestMongoClientStats(unittest.TestCase):
+    def test_commands_by_collection(self):
+        stats = MongoClientStats(max_pool_size=10)
+        stats.connection_created(None)
+        stats.connection_checked_out(None)
+        stats.started(SimpleNamespace(command_name="find", command={"find": "workers"}, request_id=1))
+        stats.started(SimpleNamespace(command_name="ping", command={"ping": 1}, request_id=2))
+        stats.succeeded(SimpleNamespace(request_id=1, duration_micros=2000))
+        stats.failed(SimpleNamespace(request_id=2, duration_micros=1000))
+        stats.connection_checked_in(None)
+        assert stats.to_dict() == {
+            "roles": [],
+            "max_pool_size": 10,
+            "connections": 1,
+            "checked_out": 0,
+            "check_out_failures": 0,
+            "commands": {"workers": 1, "_": 1},
+            "failed_commands": {"_": 1},
+            "command_ms": {"workers": 2, "_": 1}
+        }
@@ -0,0 +1,116 @@
+import unittest
+from typing import List
+from broccoli_server.interface.worker import Worker, WorkContext
+from broccoli_server.worker import WorkerCache, WorkerPool
+
+
+class Counting(Worker):
+    built = []  # type: List[Counting]
+
+    def __init__(self, name: str):
+        self.name = name
+        self.torn_down = False
+        Counting.built.append(self)
+
+    def get_id(self) -> str:
+        return f"counting_{self.name}"
+
+    def pre_work(self, context: WorkContext):
+        pass
+
+    def work(self, context: WorkContext):
+        pass
+
+    def teardown(self):
+        self.torn_down = True
+
+
+class TestWorkerPool(unittest.TestCase):
+    def setUp(self) -> None:
+        Counting.built = []
+        worker_cache = WorkerCache()
+        worker_cache.register_module("counting", Counting)
+        self.pool = WorkerPool(worker_cache, max_size=2, idle_seconds=3600)
+
+    def acquire(self, name: str):
+        status, pooled_worker = self.pool.acquire("counting", {"name": name})
+        assert status
+        return pooled_worker
+
+    def test_reuse(self):
+        pooled_worker = self.acquire("a")
+        pooled_worker.pre_worked = True
+        self.pool.release(pooled_worker)
+        again = self.acquire("a")
+        assert again is pooled_worker and again.pre_worked
+        assert len(Counting.built) == 1
+
+    def test_unknown_module(self):
+        status, message = self.pool.acquire("unknown", {})
+        assert not status and message == "Module unknown not found"
+
+    def test_throwaway_while_busy(self):
+        pooled_worker = self.acquire("a")
+        throwaway = self.acquire("a")
+        assert throwaway is not pooled_worker
+        assert pooled_worker.pooled and not throwaway.pooled
+        self.pool.release(throwaway)
+        assert throwaway.worker.torn_down
+        self.pool.release(pooled_worker)
+        assert not pooled_worker.worker.torn_down
+        assert self.acquire("a") is pooled_worker
+
+    def test_discard(self):
+        pooled_worker = self.acquire("a")
+        self.pool.release(pooled_worker, discard=True)
+        assert pooled_worker.worker.torn_down
+        assert self.acquire("a") is not pooled_worker
+
+    def test_args_change_key(self):
+        a = self.acquire("a")
+        self.pool.release(a)
+        b = self.acquire("b")
+        assert b is not a and b.worker.name == "b"
+
+    def test_lru_eviction(self):
+        a, b = self.acquire("a"), self.acquire("b")
+        self.pool.release(a)
+        self.pool.release(b)
+        # a was used last, so b is the one evicted
+        self.pool.release(self.acquire("a"))
+        c = self.acquire("c")
+        assert b.worker.torn_down and not a.worker.torn_down
+        self.pool.release(c)
+        assert self.acquire("a") is a
+
+    def test_lru_eviction_skips_busy(self):
+        a, b = self.acquire("a"), self.acquire("b")
+        c = self.acquire("c")
+        # every pooled instance is running, the pool grows past max_size instead of tearing one down
+        assert not any(map(lambda w: w.worker.torn_down, [a, b, c]))
+        self.pool.release(a)
+        self.pool.release(b)
+        self.pool.release(c)
+        assert self.acquire("c") is c
+
+    def test_idle_eviction(self):
+        a = self.acquire("a")
+        self.pool.release(a)
+        a.last_used_seconds -= 7200
+        assert self.pool._evict_idle() == [a]
+        assert self.acquire("a") is not a
+
+    def test_idle_eviction_skips_busy(self):
+        a = self.acquire("a")
+        a.last_used_seconds -= 7200
+        assert self.pool._evict_idle() == []
+
+    def test_teardown_failure_is_logged(self):
+        a = self.acquire("a")
+
+        def fail():
+            raise RuntimeError("boom")
+
+        a.worker.teardown = fail
+        with self.assertLogs("broccoli_server.worker.worker_pool", level="ERROR"):
+            self.pool.release(a, discard=True)
@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+import unittest
+from typing import List, Optional
+from broccoli_server.utils import WorkerRunner, WorkerPayload
+
+
+class ListQueue(object):
+    def __init__(self, payloads: List[WorkerPayload]):
+        self.lock = threading.Lock()
+        self.payloads = list(payloads)
+
+    def blocking_dequeue(self, timeout_seconds: int = 0) -> Optional[WorkerPayload]:
+        with self.lock:
+            if self.payloads:
+                return self.payloads.pop(0)
+        time.sleep(0.05)
+        return None
+
+
+def payloads(module_names: List[str]) -> List[WorkerPayload]:
+    return list(map(lambda m: WorkerPayload(type="worker", module_name=m, args={}), module_names))
+
+
+class TestWorkerRunner(unittest.TestCase):
+    def setUp(self) -> None:
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.done = []  # type: List[str]
+
+    def run_payload(self, payload: WorkerPayload):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.2)
+        with self.lock:
+            self.running -= 1
+            self.done.append(payload.module_name)
+
+    def start(self, runner: WorkerRunner, queue: ListQueue):
+        started_at = time.time()
+        thread = threading.Thread(target=runner.run)
+        thread.start()
+        while time.time() - started_at < 10:
+            with queue.lock:
+                if not queue.payloads:
+                    break
+            time.sleep(0.01)
+        runner.stop()
+        thread.join()
+
+    def test_threads(self):
+        queue = ListQueue(payloads(["a", "b", "c", "d"]))
+        runner = WorkerRunner(queue, self.run_payload, lambda p: "thread", threads=2, processes=0)
+        self.start(runner, queue)
+        # stopping waits for in-flight payloads
+        assert sorted(self.done) == ["a", "b", "c", "d"]
+        # payloads stay queued while both slots are busy
+        assert self.max_running == 2
+
+    def test_slots_per_type(self):
+        queue = ListQueue(payloads(["a", "b", "c", "d"]))
+        queued = []
+
+        def run_payload(payload: WorkerPayload):
+            self.run_payload(payload)
+            with queue.lock:
+                queued.append(len(queue.payloads))
+
+        runner = WorkerRunner(queue, run_payload, lambda p: "thread", threads=1, processes=2)
+        self.start(runner, queue)
+        assert self.max_running == 1
+        # free process slots do not pull more thread payloads, only b waits outside the queue while a runs
+        assert queued[0] == 2
+
+    def test_inline_when_no_threads(self):
+        queue = ListQueue(payloads(["a", "b"]))
+        runner = WorkerRunner(queue, self.run_payload, lambda p: "thread", threads=0, processes=0)
+        self.start(runner, queue)
+        assert self.done == ["a", "b"]
+        assert self.max_running == 1
+
+    def test_processes(self):
+        parent_pid = os.getpid()
+        ran_here = []
+
+        def run_payload(payload: WorkerPayload):
+            if os.getpid() == parent_pid:
+                ran_here.append(payload.module_name)
+            time.sleep(0.2)
+
+        queue = ListQueue(payloads(["cpu_1", "cpu_2", "io"]))
+        runner = WorkerRunner(
+            queue, run_payload, lambda p: "thread" if p.module_name == "io" else "process",
+            threads=1, processes=2, report_seconds=3600
+        )
+        utilization = []
+        runner._report = lambda: utilization.append(runner.get_utilization())
+        self.start(runner, queue)
+        # only the thread mode payload ran in this process
+        assert ran_here == ["io"]
+        slots = list(utilization[-1].keys())
+        assert len(list(filter(lambda s: s.startswith("process-"), slots))) >= 1
+        assert len(list(filter(lambda s: s.startswith("worker-slot"), slots))) == 1
@@ -1,5 +1,8 @@
 from .datetime import milliseconds_to_datetime, datetime_to_milliseconds
 from .getenv_or_raise import getenv_or_raise
+from .index_registry import IndexRegistry, IndexSpec
 from .database_migration import DatabaseMigration
 from .gcd import gcd_multiple
 from .worker_queue import WorkerQueue, WorkerPayload
+from .mongo_client_registry import MongoClientRegistry, MongoClientStats
+from .worker_runner import WorkerRunner, CONCURRENCY_MODES
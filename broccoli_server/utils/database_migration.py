@@ -1,11 +1,13 @@
 import pymongo
+from typing import List, Optional
+from .index_registry import IndexSpec
 
 
 class DatabaseMigration(object):
     SCHEMA_VERSION_COLLECTION_NAME = "schema_version"
 
-    def __init__(self, admin_connection_string: str, db: str):
-        self.client = pymongo.MongoClient(admin_connection_string)
+    def __init__(self, admin_connection_string: str, db: str, client: Optional[pymongo.MongoClient] = None):
+        self.client = client if client else pymongo.MongoClient(admin_connection_string)
         self.db = self.client[db]
         self.schema_version_collection = self.db[DatabaseMigration.SCHEMA_VERSION_COLLECTION_NAME]
         self.upgrade_map = {
@@ -41,6 +43,22 @@ class DatabaseMigration(object):
             self._update_schema_version(next_schema_version)
             print(f"Performed schema migration {schema_version} to {next_schema_version}")
 
+    def apply_indexes(self, index_specs: List[IndexSpec]):
+        for spec in index_specs:
+            print(f"Applying index {spec.name()} on {spec.collection}")
+            try:
+                self.db[spec.collection].create_index(
+                    spec.keys,
+                    name=spec.name(),
+                    unique=spec.unique,
+                    sparse=spec.sparse,
+                    background=True
+                )
+            except Exception as e:
+                print(f"fail to apply index {spec.name()} on {spec.collection}, {e}")
+                raise e
+        print(f"Applied {len(index_specs)} indexes")
+
     def assert_latest(self):
         current_schema_version = self._get_schema_version()
         if current_schema_version != self.latest_schema_version:
@@ -0,0 +1,55 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+
+@dataclass
+class IndexSpec:
+    collection: str
+    keys: List[Tuple[str, int]]
+    unique: bool = False
+    sparse: bool = False
+
+    def name(self) -> str:
+        return "_".join(map(lambda k: f"{k[0]}_{k[1]}", self.keys))
+
+
+class IndexRegistry(object):
+    def __init__(self):
+        self.indexes = []  # type: List[IndexSpec]
+
+    def add(self, collection: str, keys: List[Tuple[str, int]], unique: bool = False, sparse: bool = False):
+        spec = IndexSpec(collection, keys, unique, sparse)
+        for existing_spec in self.indexes:
+            if existing_spec.collection == collection and existing_spec.name() == spec.name():
+                existing_spec.unique = existing_spec.unique or unique
+                return
+        self.indexes.append(spec)
+
+    def get_all(self) -> List[IndexSpec]:
+        return self.indexes
+
+    def is_query_indexed(self, collection: str, q: Dict, sort: Optional[Dict] = None) -> bool:
+        query_fields = IndexRegistry._get_query_fields(q)
+        sort_fields = list(sort.keys()) if sort else []
+        if not query_fields and not sort_fields:
+            return True
+        for spec in self.indexes:
+            if spec.collection != collection:
+                continue
+            first_key = spec.keys[0][0]
+            if first_key == "_id" or first_key in query_fields:
+                return True
+            if sort_fields and first_key == sort_fields[0]:
+                return True
+        return "_id" in query_fields or (bool(sort_fields) and sort_fields[0] == "_id")
+
+    @staticmethod
+    def _get_query_fields(q: Dict) -> Set[str]:
+        fields = set()
+        for key, value in q.items():
+            if key in ("$and", "$or", "$nor"):
+                for sub_q in value:
+                    fields |= IndexRegistry._get_query_fields(sub_q)
+            elif not key.startswith("$"):
+                fields.add(key)
+        return fields
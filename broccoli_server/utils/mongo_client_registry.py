@@ -0,0 +1,125 @@
+import threading
+import pymongo
+from pymongo import monitoring
+from collections import defaultdict
+from typing import Dict, List
+
+
+class MongoClientStats(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    def __init__(self, max_pool_size: int):
+        self.max_pool_size = max_pool_size
+        self.lock = threading.Lock()
+        self.roles = []  # type: List[str]
+        self.connections = 0
+        self.checked_out = 0
+        self.check_out_failures = 0
+        self.commands = defaultdict(int)  # type: Dict[str, int]
+        self.failed_commands = defaultdict(int)  # type: Dict[str, int]
+        self.command_ms = defaultdict(float)  # type: Dict[str, float]
+        self.collections = {}  # type: Dict[int, str]
+
+    def to_dict(self) -> Dict:
+        with self.lock:
+            return {
+                "roles": list(self.roles),
+                "max_pool_size": self.max_pool_size,
+                "connections": self.connections,
+                "checked_out": self.checked_out,
+                "check_out_failures": self.check_out_failures,
+                "commands": dict(self.commands),
+                "failed_commands": dict(self.failed_commands),
+                "command_ms": {collection: int(ms) for collection, ms in self.command_ms.items()}
+            }
+
+    def started(self, event):
+        # commands name their collection, which is what tells the stores sharing a client apart
+        collection = event.command.get(event.command_name)
+        with self.lock:
+            self.collections[event.request_id] = collection if isinstance(collection, str) else "_"
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    def _finish(self, event, failed: bool):
+        with self.lock:
+            collection = self.collections.pop(event.request_id, "_")
+            self.commands[collection] += 1
+            if failed:
+                self.failed_commands[collection] += 1
+            self.command_ms[collection] += event.duration_micros / 1000
+
+    def connection_created(self, event):
+        with self.lock:
+            self.connections += 1
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.connections -= 1
+
+    def connection_checked_out(self, event):
+        with self.lock:
+            self.checked_out += 1
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out -= 1
+
+    def connection_check_out_failed(self, event):
+        with self.lock:
+            self.check_out_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+
+class MongoClientRegistry(object):
+    def __init__(self, max_pool_size: int = 100):
+        self.max_pool_size = max_pool_size
+        self.lock = threading.Lock()
+        self.clients = {}  # type: Dict[str, pymongo.MongoClient]
+        self.stats = {}  # type: Dict[str, MongoClientStats]
+
+    def get(self, connection_string: str, role: str) -> pymongo.MongoClient:
+        # every store on the same connection string shares one client and so one connection pool
+        with self.lock:
+            if connection_string not in self.clients:
+                stats = MongoClientStats(self.max_pool_size)
+                self.clients[connection_string] = pymongo.MongoClient(
+                    connection_string,
+                    maxPoolSize=self.max_pool_size,
+                    event_listeners=[stats]
+                )
+                self.stats[connection_string] = stats
+            stats = self.stats[connection_string]
+            with stats.lock:
+                if role not in stats.roles:
+                    stats.roles.append(role)
+            return self.clients[connection_string]
+
+    def get_stats(self) -> List[Dict]:
+        # connection strings carry credentials, clients are told apart by their roles instead
+        with self.lock:
+            stats = list(self.stats.values())
+        return list(map(lambda s: s.to_dict(), stats))
+
+    def reset(self):
+        # a forked child must not touch the sockets or monitor threads of the parent's clients,
+        # so they are dropped without being closed and the next get builds new ones
+        self.lock = threading.Lock()
+        self.clients = {}
+        self.stats = {}
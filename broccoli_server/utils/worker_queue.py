@@ -1,6 +1,6 @@
 import json
 import redis
-from typing import Dict
+from typing import Dict, Optional
 from dataclasses import dataclass
 
 
@@ -34,8 +34,9 @@ class WorkerQueue(object):
     def enqueue(self, payload: WorkerPayload):
         self.db.rpush(self.key, json.dumps(payload.to_json()))
 
-    def blocking_dequeue(self) -> WorkerPayload:
-        item = self.db.blpop(self.key)
-        if item:
-            item = item[1]
-        return WorkerPayload.from_json(json.loads(item))
+    def blocking_dequeue(self, timeout_seconds: int = 0) -> Optional[WorkerPayload]:
+        # None once timeout_seconds passes without a payload, 0 waits forever
+        item = self.db.blpop(self.key, timeout=timeout_seconds)
+        if not item:
+            return None
+        return WorkerPayload.from_json(json.loads(item[1]))
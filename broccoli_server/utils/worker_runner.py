@@ -0,0 +1,189 @@
+import os
+import time
+import logging
+import threading
+import multiprocessing
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional, Tuple
+from .worker_queue import WorkerQueue, WorkerPayload
+
+logger = logging.getLogger(__name__)
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+CONCURRENCY_MODES = [INLINE, THREAD, PROCESS]
+
+# forked children inherit this instead of unpickling the runner
+_forked_run_payload = None  # type: Optional[Callable[[WorkerPayload], None]]
+
+
+def _run_in_process(payload_json: Dict) -> Tuple[str, float]:
+    started_at = time.time()
+    _forked_run_payload(WorkerPayload.from_json(payload_json))
+    return f"process-{os.getpid()}", time.time() - started_at
+
+
+class WorkerRunner(object):
+    def __init__(self, worker_queue: WorkerQueue, run_payload: Callable[[WorkerPayload], None],
+                 get_concurrency: Callable[[WorkerPayload], str], threads: int, processes: int,
+                 process_initializer: Optional[Callable[[], None]] = None, report_seconds: int = 60):
+        self.worker_queue = worker_queue
+        self.run_payload = run_payload
+        self.get_concurrency = get_concurrency
+        self.threads = threads
+        self.processes = processes
+        self.process_initializer = process_initializer
+        self.report_seconds = report_seconds
+        # free slots per slot type, payloads stay in the queue while every slot is busy
+        self.slots_changed = threading.Condition()
+        self.free_slots = {THREAD: threads, PROCESS: processes}  # type: Dict[str, int]
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.busy_seconds = defaultdict(float)  # type: Dict[str, float]
+        self.window_started_at = time.time()
+        self.thread_executor = None  # type: Optional[ThreadPoolExecutor]
+        self.process_executor = None  # type: Optional[ProcessPoolExecutor]
+        self.process_executor_broken = False
+
+    def run(self):
+        global _forked_run_payload
+        # children are forked before any thread slot runs, so none of them inherits a lock held mid-payload
+        if self.processes > 0:
+            _forked_run_payload = self.run_payload
+            self.process_executor = self._build_process_executor()
+        if self.threads > 0:
+            self.thread_executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="worker-slot")
+        self.window_started_at = time.time()
+        try:
+            while not self.stopping.is_set():
+                self._report_if_due()
+                if not self._wait_for_any_slot():
+                    continue
+                payload = self.worker_queue.blocking_dequeue(timeout_seconds=1)
+                if payload is None:
+                    continue
+                self._dispatch(payload)
+        finally:
+            # in-flight payloads finish before the runner returns
+            if self.thread_executor:
+                self.thread_executor.shutdown(wait=True)
+            if self.process_executor:
+                self.process_executor.shutdown(wait=True)
+            self._report()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _build_process_executor(self) -> ProcessPoolExecutor:
+        process_executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=self.process_initializer
+        )
+        # a fork context pool forks all of its children on the first submit
+        process_executor.submit(os.getpid).result()
+        return process_executor
+
+    def _wait_for_any_slot(self) -> bool:
+        if self.threads + self.processes == 0:
+            # everything runs inline on this loop
+            return True
+        with self.slots_changed:
+            return self.slots_changed.wait_for(lambda: sum(self.free_slots.values()) > 0, timeout=1)
+
+    def _take_slot(self, mode: str):
+        # the dequeued payload may need a slot type that is all busy, it waits here rather than being requeued,
+        # so at most one payload is held outside the queue
+        with self.slots_changed:
+            self.slots_changed.wait_for(lambda: self.free_slots[mode] > 0)
+            self.free_slots[mode] -= 1
+
+    def _free_slot(self, mode: str):
+        with self.slots_changed:
+            self.free_slots[mode] += 1
+            self.slots_changed.notify_all()
+
+    def _dispatch(self, payload: WorkerPayload):
+        mode = self.get_concurrency(payload)
+        if mode == PROCESS and not self.process_executor:
+            mode = THREAD
+        if mode == THREAD and not self.thread_executor:
+            mode = INLINE
+
+        if mode == INLINE:
+            try:
+                slot, seconds = self._run_timed(payload, "inline")
+                self._record(slot, seconds)
+            except Exception:
+                self._log_failure(payload)
+            return
+
+        self._take_slot(mode)
+        if mode == THREAD:
+            future = self.thread_executor.submit(self._run_timed, payload)
+        else:
+            if self.process_executor_broken:
+                self._rebuild_process_executor()
+            try:
+                future = self.process_executor.submit(_run_in_process, payload.to_json())
+            except BrokenProcessPool:
+                self._rebuild_process_executor()
+                future = self.process_executor.submit(_run_in_process, payload.to_json())
+        future.add_done_callback(lambda f: self._on_done(f, payload, mode))
+
+    def _rebuild_process_executor(self):
+        # a child died and the whole pool has to be replaced, forking waits until no thread slot is mid-payload
+        logger.error("Process pool is broken, rebuilding it")
+        self.process_executor.shutdown(wait=False)
+        with self.slots_changed:
+            self.slots_changed.wait_for(lambda: self.free_slots[THREAD] == self.threads)
+            self.process_executor = self._build_process_executor()
+            self.process_executor_broken = False
+
+    def _run_timed(self, payload: WorkerPayload, slot: Optional[str] = None) -> Tuple[str, float]:
+        started_at = time.time()
+        self.run_payload(payload)
+        return slot if slot else threading.current_thread().name, time.time() - started_at
+
+    def _on_done(self, future: Future, payload: WorkerPayload, mode: str):
+        if isinstance(future.exception(), BrokenProcessPool):
+            self.process_executor_broken = True
+        self._free_slot(mode)
+        if future.exception():
+            self._log_failure(payload, future.exception())
+            return
+        slot, seconds = future.result()
+        self._record(slot, seconds)
+
+    @staticmethod
+    def _log_failure(payload: WorkerPayload, e: Optional[BaseException] = None):
+        logger.error("Fails to run payload", exc_info=e if e else True, extra={
+            'module_name': payload.module_name,
+            'payload_args': payload.args
+        })
+
+    def _record(self, slot: str, seconds: float):
+        with self.lock:
+            self.busy_seconds[slot] += seconds
+
+    def _report_if_due(self):
+        if time.time() - self.window_started_at >= self.report_seconds:
+            self._report()
+
+    def _report(self):
+        utilization = self.get_utilization()
+        with self.lock:
+            self.busy_seconds = defaultdict(float)
+            self.window_started_at = time.time()
+        logger.info("Worker slot utilization", extra={
+            'utilization': utilization
+        })
+
+    def get_utilization(self) -> Dict[str, float]:
+        # share of the current window each slot spent running payloads, counted when a payload finishes
+        with self.lock:
+            elapsed = max(time.time() - self.window_started_at, 1e-6)
+            return {slot: round(seconds / elapsed, 3) for slot, seconds in self.busy_seconds.items()}
@@ -3,5 +3,6 @@ from .metadata_store import MetadataStoreFactory
 from .work_context import WorkContextFactory
 from .work_factory import WorkFactory
 from .worker_cache import WorkerCache
+from .worker_pool import WorkerPool, PooledWorker
 from .worker_config_store import WorkerConfigStore
 from .worker_metadata import WorkerMetadata
@@ -1,10 +1,10 @@
 import pymongo
-from typing import Dict
+from typing import Dict, Optional
 
 
 class GlobalMetadataStore(object):
-    def __init__(self, connection_string: str, db: str):
-        self.client = pymongo.MongoClient(connection_string)
+    def __init__(self, connection_string: str, db: str, client: Optional[pymongo.MongoClient] = None):
+        self.client = client if client else pymongo.MongoClient(connection_string)
         self.db = self.client[db]
         self.workers_collection = self.db["workers"]
 
@@ -17,6 +17,6 @@ class GlobalMetadataStore(object):
     def set_all(self, worker_id: str, metadata: Dict):
         self.workers_collection.update_one(
             {"worker_id": worker_id},
-            {"$set": {"state": metadata}},
+            {"$set": {"state": metadata}, "$inc": {"state_version": 1}},
             upsert=False
         )
@@ -1,16 +1,39 @@
 import pymongo
+import logging
+from typing import Optional, Dict, Any
 from broccoli_server.interface.worker import MetadataStore
 
+logger = logging.getLogger(__name__)
+
 
 class MetadataStoreImpl(MetadataStore):
-    def __init__(self, connection_string: str, db: str, worker_id: str):
-        self.client = pymongo.MongoClient(connection_string)
+    def __init__(self, connection_string: str, db: str, worker_id: str,
+                 client: Optional[pymongo.MongoClient] = None, optimistic: bool = False):
+        self.client = client if client else pymongo.MongoClient(connection_string)
         self.db = self.client[db]
         self.workers_collection = self.db["workers"]
         self.worker_id = worker_id
+        # with optimistic, a flush is dropped when the state changed since it was loaded
+        self.optimistic = optimistic
+        self._state = None  # type: Optional[Dict]
+        self._state_version = 0
+        self._pending = {}  # type: Dict[str, Any]
+
+    def preload(self, state: Dict, state_version: int):
+        # for callers that already read the worker's document, set must not write through to it
+        self._state = dict(state)
+        self._state_version = state_version
 
-    def _get_worker_state(self):
-        return self.workers_collection.find_one({"worker_id": self.worker_id})["state"]
+    def _get_worker_state(self) -> Dict:
+        # a store lives for one run, so the state is read once and later reads also see this run's writes
+        if self._state is None:
+            document = self.workers_collection.find_one(
+                {"worker_id": self.worker_id},
+                projection=["state", "state_version"]
+            )
+            self._state = dict(document.get("state", {})) if document else {}
+            self._state_version = document.get("state_version", 0) if document else 0
+        return self._state
 
     def _get_another_worker_state(self, worker_id: str):
         return self.workers_collection.find_one({"worker_id": worker_id})["state"]
@@ -22,13 +45,34 @@ class MetadataStoreImpl(MetadataStore):
         return self._get_worker_state()[key]
 
     def set(self, key: str, value):
-        state = self._get_worker_state()
-        state[key] = value
-        self.workers_collection.update_one(
-            {"worker_id": self.worker_id},
-            {"$set": {"state": state}},
+        self._get_worker_state()[key] = value
+        self._pending[key] = value
+
+    def flush(self) -> bool:
+        if not self._pending:
+            return True
+        filter_q = {"worker_id": self.worker_id}
+        if self.optimistic:
+            # a missing state_version is version 0
+            filter_q["state_version"] = self._state_version if self._state_version else {"$in": [None, 0]}
+        set_doc = {}
+        for key, value in self._pending.items():
+            set_doc[f"state.{key}"] = value
+        self._pending = {}
+        matched_count = self.workers_collection.update_one(
+            filter_q,
+            {"$set": set_doc, "$inc": {"state_version": 1}},
             upsert=False
-        )
+        ).matched_count
+        if matched_count == 0:
+            logger.error("Fails to flush worker metadata, the worker is gone or its state changed during the run",
+                         extra={
+                             'worker_id': self.worker_id,
+                             'keys': list(set_doc.keys())
+                         })
+            return False
+        self._state_version += 1
+        return True
 
     def get_from_another_worker(self, worker_id: str, key: str):
         return self._get_another_worker_state(worker_id)[key]
@@ -38,13 +82,19 @@ class MetadataStoreImpl(MetadataStore):
 
 
 class MetadataStoreFactory(object):
-    def __init__(self, connection_string: str, db: str):
+    def __init__(self, connection_string: str, db: str, client: Optional[pymongo.MongoClient] = None,
+                 optimistic: bool = False):
         self.connection_string = connection_string
         self.db = db
+        # without a shared client every built store opens its own connections
+        self.client = client
+        self.optimistic = optimistic
 
-    def build(self, worker_id: str) -> MetadataStore:
+    def build(self, worker_id: str) -> MetadataStoreImpl:
         return MetadataStoreImpl(
             connection_string=self.connection_string,
             db=self.db,
-            worker_id=worker_id
+            worker_id=worker_id,
+            client=self.client,
+            optimistic=self.optimistic
         )
@@ -1,4 +1,5 @@
 import logging
+from typing import Dict
 from .metadata_store import MetadataStoreFactory
 from broccoli_server.interface.worker import WorkContext, MetadataStore
 from broccoli_server.content import ContentStore
@@ -20,13 +21,19 @@ class WorkContextImpl(WorkContext):
     def metadata_store(self) -> MetadataStore:
         return self._metadata_store
 
+    def preload_metadata(self, state: Dict, state_version: int):
+        self._metadata_store.preload(state, state_version)
+
+    def flush_metadata(self) -> bool:
+        return self._metadata_store.flush()
+
 
 class WorkContextFactory(object):
     def __init__(self, content_store: ContentStore, metadata_store_factory: MetadataStoreFactory):
         self.content_store = content_store
         self.metadata_store_factory = metadata_store_factory
-        
-    def build(self, worker_id: str) -> WorkContext:
+
+    def build(self, worker_id: str) -> WorkContextImpl:
         return WorkContextImpl(
             worker_id=worker_id,
             content_store=self.content_store,
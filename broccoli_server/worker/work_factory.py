@@ -3,6 +3,7 @@ import time
 from typing import Optional, Callable, Tuple, Dict
 from .work_context import WorkContextFactory
 from .worker_cache import WorkerCache
+from .worker_pool import WorkerPool, PooledWorker
 from .worker_config_store import WorkerConfigStore
 from sentry_sdk import capture_exception
 from broccoli_server.interface.worker import Worker
@@ -16,49 +17,60 @@ class WorkFactory(object):
                  worker_cache: WorkerCache,
                  worker_config_store: WorkerConfigStore,
                  sentry_enabled: bool,
+                 worker_pool: WorkerPool,
                  ):
         self.work_context_factory = work_context_factory
         self.worker_cache = worker_cache
         self.worker_config_store = worker_config_store
         self.sentry_enabled = sentry_enabled
+        self.worker_pool = worker_pool
 
     def get_work_func(self, module_name: str, args: Dict) -> Optional[Tuple[Callable, str]]:
-        status, worker_or_message = self.worker_cache.load_module(module_name, args)
+        # instances live across runs, so clients built in pre_work and in-memory state stay warm
+        status, pooled_worker_or_message = self.worker_pool.acquire(module_name, args)
         if not status:
             logger.error("Fails to load worker", extra={
                 'module_name': module_name,
                 'args': args,
-                'message': worker_or_message
+                'message': pooled_worker_or_message
             })
             return None
-        worker = worker_or_message  # type: Worker
+        pooled_worker = pooled_worker_or_message  # type: PooledWorker
+        worker = pooled_worker.worker  # type: Worker
         worker_id = worker.get_id()
-        error_resiliency = self.worker_config_store.get_error_resiliency(worker_id)
-        work_context = self.work_context_factory.build(worker_id)
-        worker.pre_work(work_context)
+        try:
+            # the worker's document is read once per run, for its bookkeeping and its metadata
+            document = self.worker_config_store.get_for_run(
+                worker_id, ["error_resiliency", "error_count", "state", "state_version"]
+            )
+            if not document:
+                document = {}
+            error_resiliency = document.get("error_resiliency", -1)
+            error_count = document.get("error_count", 0)
+            work_context = self.work_context_factory.build(worker_id)
+            work_context.preload_metadata(document.get("state", {}), document.get("state_version", 0))
+            if not pooled_worker.pre_worked:
+                worker.pre_work(work_context)
+                pooled_worker.pre_worked = True
+        except Exception:
+            self.worker_pool.release(pooled_worker, discard=True)
+            raise
 
         def work_func():
+            started_at = time.time()
+            succeeded = False
             try:
                 worker.work(work_context)
-                # always reset error count
-                ok, err = self.worker_config_store.reset_error_count(worker_id)
-                if not ok:
-                    logger.error("Fails to reset error count", extra={
-                        'worker_id': worker_id,
-                        'reason': err
+                if work_context.flush_metadata():
+                    succeeded = True
+                else:
+                    # the instance's in-memory state is ahead of the stored one, the run counts as failed
+                    logger.error("Recording run as failed because its metadata was not flushed", extra={
+                        'worker_id': worker_id
                     })
             except Exception as e:
-                report_ex = True
-                if error_resiliency > 0:
-                    ok, error_count, err = self.worker_config_store.get_error_count(worker_id)
-                    if not ok:
-                        logger.error("Fails to get error count", extra={
-                            'worker_id': worker_id,
-                            'reason': err
-                        })
-                    if error_count < error_resiliency:
-                        # only not to report exception when error resiliency is set and error count is below resiliency
-                        report_ex = False
+                # only not to report exception when error resiliency is set and error count is below resiliency
+                report_ex = not (error_resiliency > 0 and error_count < error_resiliency)
 
                 if report_ex:
                     if self.sentry_enabled:
@@ -74,15 +86,32 @@ class WorkFactory(object):
                         'worker_id': worker_id
                     })
 
-                if error_resiliency > 0:
-                    # only to touch error count if error resiliency is set
-                    ok, err = self.worker_config_store.increment_error_count(worker_id)
-                    if not ok:
-                        logger.error('Fails to increment error count', extra={
-                            'worker_id': worker_id,
-                            'reason': err
-                        })
+                # metadata set before the failure is kept, as if it had been written right away,
+                # but the failure may well be the database, which must not skip recording the run
+                try:
+                    work_context.flush_metadata()
+                except Exception:
+                    logger.exception("Fails to flush worker metadata of a failed run", extra={
+                        'worker_id': worker_id
+                    })
 
-            self.worker_config_store.set_last_executed_seconds(worker_id, int(time.time()))
+            ok = False
+            try:
+                ok, err = self.worker_config_store.finish_run(
+                    worker_id,
+                    succeeded=succeeded,
+                    # only to touch error count if error resiliency is set
+                    increment_error_count=error_resiliency > 0,
+                    executed_seconds=int(time.time()),
+                    duration_seconds=time.time() - started_at
+                )
+                if not ok:
+                    logger.error("Fails to record run", extra={
+                        'worker_id': worker_id,
+                        'reason': err
+                    })
+            finally:
+                # a failed instance is not trusted with the next run, nor is one of a removed worker
+                self.worker_pool.release(pooled_worker, discard=not succeeded or not ok)
 
         return work_func, worker_id
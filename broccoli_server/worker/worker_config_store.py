@@ -1,6 +1,6 @@
 import pymongo
 import logging
-from typing import Dict, Tuple
+from typing import Dict, Tuple, Optional, List
 from .worker_cache import WorkerCache
 from .worker_metadata import WorkerMetadata
 from broccoli_server.interface.worker import Worker
@@ -9,10 +9,13 @@ logger = logging.getLogger(__name__)
 
 
 class WorkerConfigStore(object):
-    def __init__(self, connection_string: str, db: str, worker_cache: WorkerCache):
-        self.client = pymongo.MongoClient(connection_string)
+    COLLECTION_NAME = 'workers'
+
+    def __init__(self, connection_string: str, db: str, worker_cache: WorkerCache,
+                 client: Optional[pymongo.MongoClient] = None):
+        self.client = client if client else pymongo.MongoClient(connection_string)
         self.db = self.client[db]
-        self.collection = self.db['workers']
+        self.collection = self.db[WorkerConfigStore.COLLECTION_NAME]
         self.worker_cache = worker_cache
 
     def add(self, worker_metadata: WorkerMetadata) -> Tuple[bool, str]:
@@ -96,60 +99,6 @@ class WorkerConfigStore(object):
         )
         return True, ""
 
-    def increment_error_count(self, worker_id: str) -> Tuple[bool, str]:
-        if not self._if_worker_exists(worker_id):
-            return False, f"Worker with id {worker_id} does not exist"
-        self.collection.update_one(
-            filter={
-                "worker_id": worker_id
-            },
-            update={
-                "$inc": {
-                    "error_count": 1
-                }
-            }
-        )
-        return True, ""
-
-    def reset_error_count(self, worker_id: str) -> Tuple[bool, str]:
-        if not self._if_worker_exists(worker_id):
-            return False, f"Worker with id {worker_id} does not exist"
-        self.collection.update_one(
-            filter={
-                "worker_id": worker_id
-            },
-            update={
-                "$set": {
-                    "error_count": 0
-                }
-            }
-        )
-        return True, ""
-
-    def get_error_count(self, worker_id: str) -> Tuple[bool, int, str]:
-        document = self.collection.find_one(
-            filter={
-                "worker_id": worker_id
-            }
-        )
-        if not document:
-            return False, -1, f"Worker with id {worker_id} does not exist"
-        return True, document.get("error_count", 0), ""
-
-    def set_last_executed_seconds(self, worker_id: str, last_executed_seconds: int):
-        if not self._if_worker_exists(worker_id):
-            return False, f"Worker with id {worker_id} does not exist"
-        self.collection.update_one(
-            filter={
-                "worker_id": worker_id
-            },
-            update={
-                "$set": {
-                    "last_executed_seconds": last_executed_seconds
-                }
-            }
-        )
-
     def get_last_executed_seconds(self, worker_id: str) -> int:
         document = self.collection.find_one(
             filter={
@@ -160,12 +109,29 @@ class WorkerConfigStore(object):
             return 0
         return document.get("last_executed_seconds", 0)
 
-    def get_error_resiliency(self, worker_id: str) -> int:
-        document = self.collection.find_one(
+    def get_for_run(self, worker_id: str, fields: List[str]) -> Optional[Dict]:
+        return self.collection.find_one({"worker_id": worker_id}, projection=fields)
+
+    def finish_run(self, worker_id: str, succeeded: bool, increment_error_count: bool, executed_seconds: int,
+                   duration_seconds: float) -> Tuple[bool, str]:
+        # everything a run records about itself goes out in one write
+        update_doc = {
+            "$set": {
+                "last_executed_seconds": executed_seconds,
+                "last_duration_seconds": duration_seconds,
+                "last_status": "succeeded" if succeeded else "failed"
+            }
+        }
+        if succeeded:
+            update_doc["$set"]["error_count"] = 0
+        elif increment_error_count:
+            update_doc["$inc"] = {"error_count": 1}
+        matched_count = self.collection.update_one(
             filter={
                 "worker_id": worker_id
-            }
-        )
-        if not document:
-            return -1
-        return document.get("error_resiliency", -1)
+            },
+            update=update_doc
+        ).matched_count
+        if matched_count == 0:
+            return False, f"Worker with id {worker_id} does not exist"
+        return True, ""
@@ -0,0 +1,101 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Union
+from .worker_cache import WorkerCache
+from broccoli_server.interface.worker import Worker
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PooledWorker:
+    key: str
+    worker: Worker
+    pre_worked: bool = False
+    in_use: bool = False
+    last_used_seconds: float = 0.0
+    # a worker built because the pooled one was busy is torn down after its run
+    pooled: bool = True
+
+
+class WorkerPool(object):
+    def __init__(self, worker_cache: WorkerCache, max_size: int, idle_seconds: int):
+        self.worker_cache = worker_cache
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self._pool = OrderedDict()  # type: OrderedDict
+
+    @staticmethod
+    def _get_key(module_name: str, args: Dict) -> str:
+        # changed args make a new key, the instance built from the old ones idles out
+        return json.dumps([module_name, args], sort_keys=True)
+
+    def acquire(self, module_name: str, args: Dict) -> Tuple[bool, Union[str, PooledWorker]]:
+        key = WorkerPool._get_key(module_name, args)
+        evicted = self._evict_idle()
+        try:
+            with self.lock:
+                pooled_worker = self._pool.get(key)
+                if pooled_worker and not pooled_worker.in_use:
+                    pooled_worker.in_use = True
+                    self._pool.move_to_end(key)
+                    return True, pooled_worker
+                pool_new_worker = pooled_worker is None and self.max_size > 0
+            status, worker_or_message = self.worker_cache.load_module(module_name, args)
+            if not status:
+                return False, worker_or_message
+            pooled_worker = PooledWorker(key=key, worker=worker_or_message, in_use=True, pooled=pool_new_worker)
+            if pool_new_worker:
+                with self.lock:
+                    if key in self._pool:
+                        # another run pooled an instance meanwhile, keep that one
+                        pooled_worker.pooled = False
+                    else:
+                        self._pool[key] = pooled_worker
+                        while len(self._pool) > self.max_size:
+                            lru_key = next((k for k, w in self._pool.items() if not w.in_use), None)
+                            if lru_key is None:
+                                break
+                            evicted.append(self._pool.pop(lru_key))
+            return True, pooled_worker
+        finally:
+            self._teardown(evicted)
+
+    def release(self, pooled_worker: PooledWorker, discard: bool = False):
+        with self.lock:
+            pooled_worker.in_use = False
+            pooled_worker.last_used_seconds = time.time()
+            if discard and self._pool.get(pooled_worker.key) is pooled_worker:
+                del self._pool[pooled_worker.key]
+                pooled_worker.pooled = False
+        if not pooled_worker.pooled:
+            self._teardown([pooled_worker])
+
+    def _evict_idle(self) -> List[PooledWorker]:
+        evicted = []
+        idle_before = time.time() - self.idle_seconds
+        with self.lock:
+            for key, pooled_worker in list(self._pool.items()):
+                if not pooled_worker.in_use and pooled_worker.last_used_seconds < idle_before:
+                    evicted.append(self._pool.pop(key))
+        return evicted
+
+    @staticmethod
+    def _teardown(pooled_workers: List[PooledWorker]):
+        for pooled_worker in pooled_workers:
+            try:
+                pooled_worker.worker.teardown()
+            except Exception:
+                logger.exception("Fails to tear down worker", extra={
+                    'worker_id': pooled_worker.worker.get_id()
+                })
+
+    def reset(self):
+        # a forked child inherits instances that may be mid-run in the parent, it starts empty instead
+        self.lock = threading.Lock()
+        self._pool = OrderedDict()
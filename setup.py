@@ -8,7 +8,7 @@ install_requires = [
     'jinja2==2.10.1',
     'flask==1.0.3',
     'pika==1.0.1',
-    'pymongo==3.8.0',
+    'pymongo==3.13.0',
     'flask-cors==3.0.8',
     'flask-jwt-extended==3.25.0',
     'dnspython==1.16.0',
@@ -16,6 +16,7 @@ install_requires = [
     'apscheduler==3.6.0',
     'sentry-sdk==0.14.3',
     'redis==3.5.3',
+    'numpy==1.19.5',
     # contrib
     'oauthlib==3.1.0',
     'requests==2.22.0',
@@ -1,6 +1,6 @@
 import axios, { AxiosInstance } from "axios";
 import Board from "./Board";
-import BoardRender from "./BoardRender";
+import BoardRender, {BoardCursor, BoardPatch} from "./BoardRender";
 import JobRun from "./JobRun";
 
 export default class ApiClient {
@@ -60,12 +60,29 @@ export default class ApiClient {
     return this.axios.get(`${this.endpoint}/apiInternal/boards`).then((response) => response.data);
   }
 
-  public async renderBoard(boardId: string): Promise<BoardRender> {
-    return this.axios.get(`${this.endpoint}/apiInternal/renderBoard/${boardId}`).then((response) => response.data);
+  public async renderBoard(boardId: string, cursor: BoardCursor = {}): Promise<BoardRender> {
+    return this.axios.get(`${this.endpoint}/apiInternal/renderBoard/${boardId}`, {
+      params: cursor,
+    }).then((response) => response.data);
   }
 
-  public async callbackBoard(boardId: string, callbackId: string, rawDocument: object): Promise<BoardRender> {
-    return this.axios.post(`${this.endpoint}/apiInternal/callbackBoard/${boardId}/${callbackId}`, rawDocument);
+  public async callbackBoard(boardId: string, callbackId: string, rawDocument: object,
+                             cursor: BoardCursor = {}): Promise<BoardRender | BoardPatch> {
+    return this.axios.post(`${this.endpoint}/apiInternal/callbackBoard/${boardId}/${callbackId}`, rawDocument, {
+      params: cursor,
+    });
+  }
+
+  public async callbackBoardBatch(boardId: string, callbackId: string, rawDocuments: object[],
+                                  cursor: BoardCursor = {}): Promise<BoardRender | BoardPatch> {
+    return this.axios.post(`${this.endpoint}/apiInternal/callbackBoardBatch/${boardId}/${callbackId}`, rawDocuments, {
+      params: cursor,
+    });
+  }
+
+  public getBoardEventsUrl(boardId: string): string {
+    const token = localStorage.getItem(this.TokenLocalStorageKey) || "";
+    return `${this.endpoint}/apiInternal/boardEvents/${boardId}?jwt=${encodeURIComponent(token)}`;
   }
 
   public async getWorkers() {
@@ -10,8 +10,13 @@ export const ActionableRenderTypes = new Set(["button"]);
 
 export type RenderDataTypes = ButtonData | ImageData | ImageListData | TextData | VideoData;
 
+export interface RawDocument {
+  _id: string;
+  [key: string]: any;
+}
+
 export interface Row {
-  raw_document: object;
+  raw_document: RawDocument;
   renders: {
     [key: string]: {
       type: RenderTypes,
@@ -29,5 +34,28 @@ export default interface BoardRender {
     limit?: number,
   };
   count_without_limit: number;
+  count_without_limit_capped: boolean;
+  count_without_limit_estimated: boolean;
+  column_timings: {
+    [key: string]: {
+      elapsed_ms: number,
+      timed_out: boolean,
+    },
+  };
   payload: Row[];
+  has_prev: boolean;
+  prev_to?: string;
+  has_next: boolean;
+  next_from?: string;
+}
+
+export interface BoardCursor {
+  from?: string;
+  to?: string;
+}
+
+export interface BoardPatch {
+  rows: Row[];
+  removed_ids: string[];
+  inserted_ids?: string[];
 }
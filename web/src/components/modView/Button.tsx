@@ -1,5 +1,6 @@
 import React from "react";
 import ApiClient from "../../api/ApiClient";
+import BoardRender, {BoardCursor, BoardPatch} from "../../api/BoardRender";
 import { Button as MuiButton } from "@material-ui/core"
 
 export interface ButtonData {
@@ -13,14 +14,17 @@ interface Props {
   callbackId: string;
   rawDocument?: object;
   getRawDocument?: () => object[];
+  cursor: BoardCursor;
   apiClient: ApiClient;
   reloading: () => void;
-  reload: (BoardRender) => void;
+  reload: (response: BoardRender | BoardPatch) => void;
   reloadFinished: () => void;
 }
 
 const Button: React.FunctionComponent<Props> = (props: Props) => {
-  const { data, boardId, callbackId, rawDocument, apiClient, reloading, reload, reloadFinished, getRawDocument } = props;
+  const {
+    data, boardId, callbackId, rawDocument, cursor, apiClient, reloading, reload, reloadFinished, getRawDocument,
+  } = props;
   if (rawDocument === undefined && getRawDocument === undefined) {
     return <div>Neither rawDocument nor getRawDocument</div>;
   }
@@ -30,23 +34,21 @@ const Button: React.FunctionComponent<Props> = (props: Props) => {
       variant="contained"
       color="secondary"
       onClick={() => {
-        let rawDocuments: object[];
-        if (getRawDocument !== undefined) {
-          rawDocuments = (getRawDocument as () => object[])();
-        } else {
-          rawDocuments = [(rawDocument as object)];
-        }
         if (reloadAfterCallback) {
           reloading()
         }
-        Promise.all(rawDocuments.map((d) =>
-          apiClient.callbackBoard(boardId, callbackId, d),
-        ))
-          .then(responses => {
-            // @ts-ignore
-            const boardRenders = responses.map(r => r.data)
+        let callback;
+        if (getRawDocument !== undefined) {
+          // multi-action rows go out as one bulk callback
+          callback = apiClient.callbackBoardBatch(boardId, callbackId, (getRawDocument as () => object[])(), cursor);
+        } else {
+          callback = apiClient.callbackBoard(boardId, callbackId, rawDocument as object, cursor);
+        }
+        callback
+          .then(response => {
             if (reloadAfterCallback) {
-              reload(boardRenders[boardRenders.length - 1])
+              // @ts-ignore
+              reload(response.data)
             }
           })
           .catch((e) => {
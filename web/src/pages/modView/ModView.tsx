@@ -1,12 +1,15 @@
 import React from "react";
 import {RouteComponentProps, withRouter} from "react-router-dom";
-import BoardRender, {ActionableRenderTypes, RenderDataTypes, RenderTypes, Row} from "../../api/BoardRender";
+import BoardRender, {
+  ActionableRenderTypes, BoardCursor, BoardPatch, RenderDataTypes, RenderTypes, Row,
+} from "../../api/BoardRender";
 import Button from "../../components/modView/Button";
 import Image from "../../components/modView/Image";
 import ImageList from "../../components/modView/ImageList";
 import Text from "../../components/modView/Text";
 import Video from "../../components/modView/Video";
 import {
+  Button as MuiButton,
   CircularProgress, FormControlLabel,
   Grid,
   Paper,
@@ -27,6 +30,9 @@ interface State {
   loading: boolean;
   error?: Error
   boardRender: BoardRender | {};
+  cursor: BoardCursor;
+  newRowCount: number;
+  stale: boolean;
   multiActionOn: boolean;
   multiActionSelectedIndexes: Set<number>;
   multiActionLastSelectedIndex: number;
@@ -37,12 +43,16 @@ class ModView extends React.Component<Props, State> {
   private static InitialState = {
     loading: true,
     boardRender: {},
+    cursor: {},
+    newRowCount: 0,
+    stale: false,
     multiActionOn: false,
     multiActionSelectedIndexes: new Set<number>(),
     multiActionLastSelectedIndex: -1,
     holdingShift: false,
   };
   private readonly boardId: string;
+  private boardEvents?: EventSource;
 
   constructor(props: Props) {
     super(props);
@@ -50,9 +60,9 @@ class ModView extends React.Component<Props, State> {
     this.state = ModView.InitialState;
   }
 
-  loadQuery = () => {
-    this.setState(ModView.InitialState);
-    this.props.apiClient.renderBoard(this.boardId)
+  loadQuery = (cursor: BoardCursor = {}) => {
+    this.setState({...ModView.InitialState, cursor});
+    this.props.apiClient.renderBoard(this.boardId, cursor)
       .then(boardRender => this.setState({ boardRender }))
       .catch(error => {
         this.setState({ error })
@@ -66,11 +76,24 @@ class ModView extends React.Component<Props, State> {
     document.addEventListener("keydown", this.keyDown, false);
     document.addEventListener("keyup", this.keyUp, false);
     this.loadQuery();
+    // rows written while the board is open are pushed instead of polled
+    this.boardEvents = new EventSource(this.props.apiClient.getBoardEventsUrl(this.boardId));
+    this.boardEvents.addEventListener("patch", (e) => {
+      if (!this.state.loading) {
+        this.applyPatch(JSON.parse((e as MessageEvent).data));
+      }
+    });
+    this.boardEvents.addEventListener("stale", () => {
+      this.setState({ stale: true });
+    });
   }
 
   public componentWillUnmount(): void {
     document.removeEventListener("keydown", this.keyDown, false);
     document.removeEventListener("keyup", this.keyUp, false);
+    if (this.boardEvents) {
+      this.boardEvents.close();
+    }
   }
 
   public renderCell = (
@@ -102,13 +125,12 @@ class ModView extends React.Component<Props, State> {
         callbackId={callbackId}
         rawDocument={rawDocument}
         getRawDocument={getRawDocument}
+        cursor={this.state.cursor}
         apiClient={this.props.apiClient}
         reloading={() => {
           this.setState({ loading: true })
         }}
-        reload={(boardRender) => {
-          this.setState({ boardRender })
-        }}
+        reload={this.applyCallbackResponse}
         reloadFinished={() => {
           this.setState({ loading: false })
         }}
@@ -116,6 +138,42 @@ class ModView extends React.Component<Props, State> {
     )
   }
 
+  public applyCallbackResponse = (response: BoardRender | BoardPatch) => {
+    if ("payload" in response) {
+      this.setState({ boardRender: response });
+      return;
+    }
+    this.applyPatch(response);
+  }
+
+  public applyPatch = (patch: BoardPatch) => {
+    // touched rows are replaced and rows that left the board's query are dropped.
+    // Inserted rows are only counted since their place on the page is unknown, edited rows
+    // missing from this page are on other pages and already counted
+    const boardRender = this.state.boardRender as BoardRender;
+    const updatedRows = new Map(patch.rows.map((row): [string, Row] => [row.raw_document._id, row]));
+    const removedIds = new Set(patch.removed_ids);
+    const shownIds = new Set(boardRender.payload.map((row) => row.raw_document._id));
+    const payload = boardRender.payload
+      .filter((row) => !removedIds.has(row.raw_document._id))
+      .map((row) => updatedRows.get(row.raw_document._id) || row);
+    const removedCount = boardRender.payload.length - payload.length;
+    const insertedIds = new Set(patch.inserted_ids || []);
+    const newRowCount = patch.rows
+      .filter((row) => insertedIds.has(row.raw_document._id) && !shownIds.has(row.raw_document._id))
+      .length;
+    this.setState({
+      boardRender: {
+        ...boardRender,
+        payload,
+        count_without_limit: boardRender.count_without_limit - removedCount + newRowCount,
+      },
+      newRowCount: this.state.newRowCount + newRowCount,
+      multiActionSelectedIndexes: removedCount > 0 ? new Set<number>() : this.state.multiActionSelectedIndexes,
+      multiActionLastSelectedIndex: removedCount > 0 ? -1 : this.state.multiActionLastSelectedIndex,
+    });
+  }
+
   public onToggleRowMultiAction = (index: number) => {
     const newSelectedIndexes = new Set<number>(this.state.multiActionSelectedIndexes.values());
     if (newSelectedIndexes.has(index)) {
@@ -247,6 +305,27 @@ class ModView extends React.Component<Props, State> {
     );
   }
 
+  public renderPagination = () => {
+    const boardRender = (this.state.boardRender as BoardRender);
+    if (!boardRender.has_prev && !boardRender.has_next) {
+      return null;
+    }
+    return (
+      <Grid container justify="space-between" style={{marginTop: 12}}>
+        <MuiButton
+          variant="contained"
+          disabled={!boardRender.has_prev}
+          onClick={() => this.loadQuery({to: boardRender.prev_to})}
+        >Previous page</MuiButton>
+        <MuiButton
+          variant="contained"
+          disabled={!boardRender.has_next}
+          onClick={() => this.loadQuery({from: boardRender.next_from})}
+        >Next page</MuiButton>
+      </Grid>
+    );
+  }
+
   public renderMultiActions = () => {
     const boardRender = (this.state.boardRender as BoardRender);
     const payload = boardRender.payload;
@@ -339,8 +418,15 @@ class ModView extends React.Component<Props, State> {
     const boardRender: BoardRender = this.state.boardRender as BoardRender;
     return (
       <React.Fragment>
-        <Typography>Mod view "{this.boardId}" ({boardRender.count_without_limit})</Typography>
+        <Typography>Mod view "{this.boardId}" ({boardRender.count_without_limit_estimated ? "~" : ""}{boardRender.count_without_limit}{boardRender.count_without_limit_capped ? "+" : ""})</Typography>
+        {this.state.newRowCount > 0 || this.state.stale ?
+          <MuiButton onClick={() => this.loadQuery(this.state.cursor)}>
+            {this.state.stale ? "Board changed" : `${this.state.newRowCount} new rows`}, click to reload
+          </MuiButton> :
+          null
+        }
         {this.renderPayload()}
+        {this.renderPagination()}
       </React.Fragment>
     );
   }